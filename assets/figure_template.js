@@ -0,0 +1,14 @@
+// Figure template of the dashboard
+// The server sends the figures without their template, the page holds it once in the figure_template store.
+// Every figure is passed through here on its way from its *_data store to its graph and gets the template back.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    template: {
+        apply: function(figure, template) {
+            if (!figure || !template) {
+                return window.dash_clientside.no_update;
+            }
+            var layout = Object.assign({}, figure.layout, {template: template});
+            return Object.assign({}, figure, {layout: layout});
+        }
+    }
+});
@@ -0,0 +1,21 @@
+// Clientside map restyling (MAP_MODE=clientside)
+// The server sends the values of the selected map variable for all years once, moving the year slider
+// only swaps the value vector of the existing choropleth trace without a round-trip to the server.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    map: {
+        restyle: function(data, year, figure) {
+            if (!data || !figure || !figure.data || !figure.data.length) {
+                return window.dash_clientside.no_update;
+            }
+            var index = data.years.indexOf(year);
+            if (index < 0) {
+                return window.dash_clientside.no_update;
+            }
+            var trace = Object.assign({}, figure.data[0], {z: data.values[index], meta: data.variable});
+            var coloraxis = Object.assign({}, figure.layout.coloraxis);
+            coloraxis.colorbar = Object.assign({}, coloraxis.colorbar, {title: {text: data.variable}});
+            var layout = Object.assign({}, figure.layout, {coloraxis: coloraxis});
+            return Object.assign({}, figure, {data: [trace].concat(figure.data.slice(1)), layout: layout});
+        }
+    }
+});
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+
+#run from the repository root: python benchmarks/bench_callbacks.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import plotly.io as pio
+
+import dash_app
+
+#Figure callbacks and the inputs each of them listens to
+CALLBACKS = [(dash_app.update_pie_top_region, ['slct_dropdown_region_top', 'slct_slider_top_region']),
+             (dash_app.update_barchart_top_type, ['slct_dropdown_type_top', 'slct_slider_top_type']),
+             (dash_app.update_barchart_prediction, ['slct_dropdown_region_pred', 'slct_dropdown_type_pred']),
+             (dash_app.update_pie_RF_importance, ['slct_dropdown_type_RF_importance']),
+             (dash_app.update_map, ['slct_dropdown_df_map', 'slct_dropdown_type_map', 'slct_slider_map'])]
+
+#Initial value of every input as defined in the layout
+DEFAULTS = {component.id: component.value for component in [dash_app.dropdown_region_top, dash_app.slider_top_region,
+                                                            dash_app.dropdown_type_top, dash_app.slider_top_type,
+                                                            dash_app.dropdown_region_pred, dash_app.dropdown_type_pred,
+                                                            dash_app.dropdown_type_RF_importance, dash_app.dropdown_df_map,
+                                                            dash_app.dropdown_type_map, dash_app.slider_map]}
+
+
+#A few values every input is changed to, taken from the options of the components
+def sample_values(input_id, n):
+    years = sorted(dash_app.dff['year'].unique().tolist())
+    regions = [option["value"] for option in dash_app.Bezirksregionen_names]
+    if "slider" in input_id:
+        return years[-n:]
+    if "region" in input_id:
+        return regions[:n]
+    if input_id == 'slct_dropdown_df_map':
+        return dash_app.df_names
+    if input_id == 'slct_dropdown_type_map':
+        return [option["value"] for option in dash_app.variable_names][:n]
+    return dash_app.crime_types[:n]
+
+
+def run_callbacks(callbacks, values):
+    payload = 0
+    for callback, input_ids in callbacks:
+        fig = callback(*[values[input_id] for input_id in input_ids])
+        payload += len(pio.to_json(fig, validate=False))
+    return payload
+
+
+#Before the split every interaction copied the dataframes and rebuilt all five figures
+def interaction_before(values):
+    dash_app.df.copy(), dash_app.df_per_pop.copy(), dash_app.df_per_area.copy()
+    dash_app.df_pred_prophet.copy(), dash_app.df_RF_feature_importances.copy().T
+    return run_callbacks(CALLBACKS, values)
+
+
+#After the split only the callback listening to the changed input runs
+def interaction_after(values, input_id):
+    return run_callbacks([c for c in CALLBACKS if input_id in c[1]], values)
+
+
+def measure(func):
+    start = time.perf_counter()
+    payload = func()
+    return time.perf_counter() - start, payload
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Latency and payload of every dashboard interaction before and after splitting the callback")
+    parser.add_argument("--values", type=int, default=3, help="number of values every input is changed to")
+    args = parser.parse_args()
+
+    print(f"{'input':<34}{'before ms':>10}{'after ms':>10}{'before KiB':>12}{'after KiB':>11}")
+    for input_id in DEFAULTS:
+        before, after = [], []
+        for value in sample_values(input_id, args.values):
+            values = dict(DEFAULTS, **{input_id: value})
+            before.append(measure(lambda: interaction_before(values)))
+            after.append(measure(lambda: interaction_after(values, input_id)))
+        print(f"{input_id:<34}"
+              f"{statistics.median(t for t, _ in before) * 1000:>10.1f}{statistics.median(t for t, _ in after) * 1000:>10.1f}"
+              f"{statistics.median(b for _, b in before) / 1024:>12.1f}{statistics.median(b for _, b in after) / 1024:>11.1f}")
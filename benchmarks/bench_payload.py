@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import random
+import argparse
+import statistics
+
+#run from the repository root: python benchmarks/bench_payload.py
+#Bytes the dashboard sends per response, uncompressed and with the gzip and brotli compression of the server: every
+#server callback for a sample of its inputs, the page, the layout and the map geometry of every level.
+#  python benchmarks/bench_payload.py --save benchmarks/payload_baseline.json     records the current sizes
+#  python benchmarks/bench_payload.py --compare benchmarks/payload_baseline.json  fails if a response grew by more than --tolerance
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dash_app
+from load_test import Dashboard
+
+ENCODINGS = ["identity", "gzip", "br"]
+
+
+#The Flask test client of the dashboard with the interface of load_test.Client, requesting an encoding
+class TestClient:
+    def __init__(self, server):
+        self.client = server.test_client()
+
+    def request(self, method, path, body=None, encoding="identity"):
+        response = self.client.open(path, method=method, data=body, content_type="application/json" if body else None,
+                                    headers={"Accept-Encoding": encoding})
+        data = response.get_data()
+        response.close()
+        return response.status_code, data, response.headers.get("Content-Encoding", "identity")
+
+    def get_json(self, path):
+        status, data, _ = self.request("GET", path)
+        if status != 200:
+            raise RuntimeError(f"GET {path} returned {status}")
+        return json.loads(data)
+
+
+#Sizes of one request in every encoding, the response has to be in the requested encoding (or identity when the server
+#does not compress it)
+def sizes(client, method, path, body=None):
+    result = {}
+    for encoding in ENCODINGS:
+        status, data, sent = client.request(method, path, body, encoding)
+        if status != 200 or sent not in (encoding, "identity"):
+            raise RuntimeError(f"{method} {path} returned {status} with Content-Encoding {sent} for {encoding}")
+        result[encoding] = len(data)
+    return result
+
+
+def measure(samples, seed):
+    client = TestClient(dash_app.server)
+    dashboard = Dashboard(client)
+    rng = random.Random(seed)
+    rows = {"/": [sizes(client, "GET", "/")], "_dash-layout": [sizes(client, "GET", "/_dash-layout")]}
+    for level, etag in dash_app.geometry_etags.items():
+        rows[f"geometry {level}"] = [sizes(client, "GET", f"/geometry/{level}.geojson?v={etag}")]
+    for callback in dashboard.callbacks:
+        inputs = [item["id"] for item in callback["inputs"] if item["id"] in dashboard.options]
+        rows[callback["output"]] = []
+        for _ in range(samples):
+            values = dict(dashboard.values, **{id: rng.choice(dashboard.options[id]) for id in inputs})
+            body = dashboard.payload(callback, values, inputs[0] if inputs else None)
+            rows[callback["output"]].append(sizes(client, "POST", "/_dash-update-component", body))
+    return {name: {encoding: statistics.mean(row[encoding] for row in measured) for encoding in ENCODINGS}
+            for name, measured in rows.items()}
+
+
+#Responses that grew by more than tolerance percent in any encoding
+def regressions(report, baseline, tolerance):
+    found = []
+    for name, expected in baseline.items():
+        for encoding, size in expected.items():
+            current = report.get(name, {}).get(encoding)
+            if current is not None and current > size * (1 + tolerance / 100):
+                found.append(f"{name} {encoding}: {size:.0f} -> {current:.0f} bytes")
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report the bytes of every dashboard response uncompressed, gzip and brotli compressed")
+    parser.add_argument("--samples", type=int, default=20, help="input combinations per callback")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the report as JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare with, exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=5, help="percent a response may grow before it is a regression")
+    args = parser.parse_args()
+
+    report = measure(args.samples, args.seed)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(f"{'response':<32}" + "".join(f"{encoding + ' B':>12}" for encoding in ENCODINGS) + (f"{'baseline br B':>15}" if baseline else ""))
+    for name, row in report.items():
+        line = f"{name:<32}" + "".join(f"{row[encoding]:>12.0f}" for encoding in ENCODINGS)
+        if baseline:
+            line += f"{baseline.get(name, {}).get('br', float('nan')):>15.0f}"
+        print(line)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if baseline:
+        found = regressions(report, baseline, args.tolerance)
+        for regression in found:
+            print(f"regression: {regression}", file=sys.stderr)
+        sys.exit(1 if found else 0)
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import argparse
+
+import pandas as pd
+
+#run from the repository root: python benchmarks/bench_point_aggregation.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import etl
+import spatial_aggregation
+
+
+#Street light counts as the notebook computed them: a Point per lamp, reprojection to EPSG:4326 and gpd.sjoin
+def sjoin_counts(shapefile, lights):
+    import geopandas as gpd
+    from shapely.geometry import Point
+
+    LOR_gpd = gpd.read_file(shapefile)
+    LOR_gpd.crs = "epsg:25833"
+    LOR_gpd = LOR_gpd.to_crs(epsg=4326)
+    Oeffentliche_Beleuchtung = pd.concat(lights)
+    geometry = [Point(xy) for xy in zip(Oeffentliche_Beleuchtung['East'], Oeffentliche_Beleuchtung['North'])]
+    Oeffentliche_Beleuchtung_gpd = gpd.GeoDataFrame(Oeffentliche_Beleuchtung, crs="epsg:25833", geometry=geometry).to_crs(epsg=4326)
+    Beleuchtung_LOR = gpd.sjoin(Oeffentliche_Beleuchtung_gpd, LOR_gpd, how='left')
+    return Beleuchtung_LOR.groupby('SCHLUESSEL').size()
+
+
+#The same counts from the STRtree aggregation in the native CRS
+def strtree_counts(shapefile, lights):
+    regions = spatial_aggregation.load_regions(shapefile)
+    counts = spatial_aggregation.count_points(regions, iter(lights))
+    return counts[counts > 0]
+
+
+def best_of(func, repeats, *args):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        durations.append(time.perf_counter() - start)
+    return result, min(durations)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the street light aggregation of the notebook (sjoin) with the STRtree aggregation")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    paths = etl.STAGES["lighting"][0]()
+    shapefile = paths[0]
+    #the XLS files are parsed once up front, so only the aggregation is timed
+    lights = [etl.cached_file(path, etl.read_lighting) for path in paths[3:]]
+    print(f"{sum(len(df) for df in lights)} street lights in {len(lights)} files")
+
+    old, old_time = best_of(sjoin_counts, args.repeats, shapefile, lights)
+    new, new_time = best_of(strtree_counts, args.repeats, shapefile, lights)
+    same = old.sort_index().astype(int).equals(new.rename_axis(old.index.name).rename(None).sort_index().astype(int))
+    print(f"{'sjoin (EPSG:4326)':<20} {old_time:8.3f}s")
+    print(f"{'STRtree (EPSG:25833)':<20} {new_time:8.3f}s")
+    print(f"speedup              {old_time / new_time:8.1f}x   identical counts: {same}")
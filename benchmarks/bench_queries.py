@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import itertools
+
+#run from the repository root: python benchmarks/bench_queries.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dash_app
+
+q = dash_app.crime_queries
+df = dash_app.df
+df_pred = dash_app.df_pred_prophet
+dfs_map = {"Total": dash_app.df, "Per capita": dash_app.df_per_pop, "Per square kilometer": dash_app.df_per_area}
+pie_columns = q.crime_types[1:]
+
+
+#Selections as the callbacks made them before the query layer: boolean masks over the merged frames
+def old_pie(year, region):
+    return df[(df["year"] == year) & (df["Bezirksregion"] == region)][pie_columns].iloc[:1].values.flatten()
+
+def old_bar(year, crime_type):
+    return df[df["year"] == year].nlargest(10, crime_type)
+
+def old_prediction(region, crime_type):
+    return df_pred[df_pred.index.get_level_values("Bezirksregion") == region][crime_type]
+
+def old_map(view, year, variable):
+    dff_map = dfs_map[view]
+    return dff_map[dff_map["year"] == year][variable]
+
+
+#The same selections answered by the query layer
+def new_pie(year, region):
+    return q.region_values(year, region, pie_columns)
+
+def new_bar(year, crime_type):
+    return q.top_regions(year, crime_type, 10)
+
+def new_prediction(region, crime_type):
+    return q.region_predictions(region, crime_type)
+
+def new_map(view, year, variable):
+    return q.value_vector(view, year, variable)
+
+
+#Every dropdown/slider combination of each figure
+COMBINATIONS = {"pie top region": (old_pie, new_pie, list(itertools.product(q.years, q.regions))),
+                "bar top type": (old_bar, new_bar, list(itertools.product(q.years, q.crime_types))),
+                "prediction bar": (old_prediction, new_prediction, list(itertools.product(q.regions, q.crime_types))),
+                "map": (old_map, new_map, list(itertools.product(dash_app.df_names, q.years, q.variables)))}
+
+
+def time_all(func, combinations):
+    start = time.perf_counter()
+    for args in combinations:
+        func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    print(f"{'query':<16}{'combinations':>13}{'masks us/op':>13}{'layer us/op':>13}{'speedup':>9}")
+    for name, (old, new, combinations) in COMBINATIONS.items():
+        old_time = time_all(old, combinations)
+        new_time = time_all(new, combinations)
+        n = len(combinations)
+        print(f"{name:<16}{n:>13}{old_time / n * 1e6:>13.1f}{new_time / n * 1e6:>13.1f}{old_time / new_time:>8.0f}x")
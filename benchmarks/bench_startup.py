@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+import argparse
+
+#run from the repository root: python benchmarks/bench_startup.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_store
+
+
+#Time a loader a number of times and return the individual durations in seconds
+def time_loader(loader, repeats):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        loader()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def report(name, durations):
+    print(f"{name:<16} best {min(durations):8.3f}s   mean {sum(durations) / len(durations):8.3f}s   ({len(durations)} runs)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare dashboard table loading from Excel and from the Parquet store")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if not data_store.store_is_fresh():
+        data_store.build_store()
+
+    excel = time_loader(data_store.load_excel_tables, args.repeats)
+    store = time_loader(data_store.load_store_tables, args.repeats)
+    report("Excel", excel)
+    report("Parquet store", store)
+    print(f"speedup (best)   {min(excel) / min(store):8.1f}x")
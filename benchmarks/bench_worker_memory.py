@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+import http.client
+
+#run from the repository root: python benchmarks/bench_worker_memory.py --workers 4
+#Starts the dashboard under gunicorn in every mode, replays some interactions so the workers reach a steady state and
+#reports the memory of every worker from /proc/<pid>/smaps_rollup (Linux only):
+#  RSS  resident memory, pages shared with the master and the other workers count fully for every worker
+#  PSS  proportional share, shared pages are divided among the processes sharing them
+#  USS  private memory of the worker, what an additional worker costs
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ROOT, MODES, Client, Dashboard, free_port, virtual_user
+
+
+def smaps_rollup(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {"RSS": values["Rss"], "PSS": values["Pss"], "USS": values["Private_Clean"] + values["Private_Dirty"]}
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def measure(mode, workers, warmup):
+    port = free_port()
+    env = dict(os.environ)
+    env.pop("SHARED_DATA", None)
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "dash_app:server", "--workers", str(workers),
+                                "--bind", f"127.0.0.1:{port}"] + MODES[mode], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = f"http://127.0.0.1:{port}"
+        deadline = time.perf_counter() + 300
+        while True:
+            try:
+                dashboard = Dashboard(Client(url, timeout=5))
+                break
+            except (OSError, RuntimeError, http.client.HTTPException):
+                if process.poll() is not None or time.perf_counter() > deadline:
+                    raise RuntimeError(f"gunicorn did not start in {mode} mode")
+                time.sleep(0.5)
+        #every worker has to import the dashboard and answer requests before it is measured
+        while len(children(process.pid)) < workers:
+            time.sleep(0.5)
+        results, lock = [], threading.Lock()
+        users = [threading.Thread(target=virtual_user, args=(url, dashboard, time.perf_counter() + warmup, i, 0, results, lock))
+                 for i in range(2 * workers)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        return smaps_rollup(process.pid), [smaps_rollup(pid) for pid in children(process.pid)]
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report the memory of the gunicorn workers with separate, preloaded and shared data")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--warmup", type=float, default=10, help="seconds of replayed interactions before measuring")
+    parser.add_argument("--modes", nargs="*", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'process':<10}{'RSS MB':>9}{'PSS MB':>9}{'USS MB':>9}")
+    for mode in args.modes:
+        master, workers = measure(mode, args.workers, args.warmup)
+        print(f"{mode:<10}{'master':<10}" + "".join(f"{master[key]:>9.1f}" for key in ["RSS", "PSS", "USS"]))
+        for key in ["RSS", "PSS", "USS"]:
+            master[key] += sum(worker[key] for worker in workers)
+        average = {key: sum(worker[key] for worker in workers) / len(workers) for key in ["RSS", "PSS", "USS"]}
+        print(f"{'':<10}{'worker':<10}" + "".join(f"{average[key]:>9.1f}" for key in ["RSS", "PSS", "USS"]) + "   (mean)")
+        print(f"{'':<10}{'total':<10}{'':>9}{master['PSS']:>9.1f}{'':>9}")
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+#run from the repository root: python benchmarks/check_imputation.py
+#Checks that the batched linear imputation fits the same trends as the per-region LinearRegression loop it replaced and
+#compares their run times on the shop and accident data. The loop's predictions carry round-off of about 1e-13, where
+#the exact prediction is an integer this can truncate to one less, those cells are listed but do not fail the check
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import etl
+import imputation
+
+TOLERANCE = 1e-8
+
+
+#Simple linear regression per region predicting the missing years of each variable, as the notebook imputed them.
+#Returns the predictions before clipping and truncation as a region x year x variable array
+def predict_per_region(df, key, years, variables):
+    from sklearn.linear_model import LinearRegression
+
+    predictions = []
+    for region, group in df.groupby(key):
+        X = np.array(group['year']).reshape((-1, 1))
+        region_predictions = []
+        for variable in variables:
+            model = LinearRegression()
+            model.fit(X, np.array(group[variable]))
+            region_predictions.append(model.predict(np.array(years).reshape((-1, 1))))
+        predictions.append(np.column_stack(region_predictions))
+    return np.stack(predictions)
+
+
+def predict_batched(df, key, years, variables):
+    _, observed_years, values, weights = imputation.region_year_array(df, key, variables)
+    return imputation.fit_linear(observed_years, values, weights, years)
+
+
+def observed_sources():
+    paths = etl.STAGES["shops"][0]()
+    shops = etl.read_shops(paths[0])
+    paths = etl.STAGES["accidents"][0]()
+    accidents = pd.concat([etl.cached_file(path, etl.read_accidents) for path in paths], ignore_index=True)
+    accidents = accidents.astype({variable: int for variable in etl.ACCIDENTS + ['year']})
+    return {"shops": (shops, 'key_1', etl.SHOPS), "accidents": (accidents, 'key_2', etl.ACCIDENTS)}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    equivalent = True
+    for name, (df, key, variables) in observed_sources().items():
+        missing_years = [year for year in etl.YEARS if year not in set(df['year'])]
+        expected, loop_time = timed(predict_per_region, df, key, missing_years, variables)
+        result, batched_time = timed(predict_batched, df, key, missing_years, variables)
+        difference = np.abs(expected - result).max()
+        equivalent &= bool(difference < TOLERANCE)
+        print(f"{name:<10} {df[key].nunique()} regions x {len(missing_years)} years   per region {loop_time:7.3f}s   "
+              f"batched {batched_time:7.3f}s   {loop_time / batched_time:6.0f}x   max difference {difference:.1e}")
+
+        truncated = lambda predictions: np.maximum(predictions, 0).astype(int)
+        flipped = np.argwhere(truncated(expected) != truncated(result))
+        regions = sorted(df[key].unique())
+        for r, y, v in flipped:
+            print(f"           {regions[r]} {missing_years[y]} {variables[v]}: {float(expected[r, y, v])!r} -> {float(result[r, y, v])!r}")
+
+        for method in imputation.METHODS:
+            imputed = imputation.predict(df, key, missing_years, variables, method)
+            print(f"           {method:<14} mean of the imputed years {imputed[variables].to_numpy().mean():8.2f}")
+    print("equivalent" if equivalent else "NOT equivalent")
+    sys.exit(0 if equivalent else 1)
@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+#Headless load test of the dashboard server
+#Virtual users replay dropdown and slider changes like a visitor of the dashboard: every step changes a single input to
+#one of its options and fires every server callback depending on that input with a POST to _dash-update-component.
+#The callbacks and the options of the inputs are read from the server's _dash-dependencies and _dash-layout.
+#  python benchmarks/load_test.py --url http://127.0.0.1:8050 --users 8 --duration 30
+#  python benchmarks/load_test.py --spawn --workers 4 --users 16     starts gunicorn with 4 workers for the test
+#  --mode shared (default, gunicorn.conf.py), preload or separate selects how the spawned workers get their data
+#Reports p50/p95/p99 latency per callback and the throughput in requests per second.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+#gunicorn arguments of the ways the workers get their data: attached to the shared memory segment of gunicorn.conf.py,
+#loaded by the master before forking or loaded by every worker. gunicorn reads ./gunicorn.conf.py by default, the modes
+#without shared data use an empty configuration instead
+MODES = {"shared": ["-c", "gunicorn.conf.py"],
+         "preload": ["-c", os.devnull, "--preload"],
+         "separate": ["-c", os.devnull]}
+
+
+class Client:
+    def __init__(self, url, timeout=60):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.connection = None
+
+    #A persistent connection per virtual user, reopened if the server closed it
+    def request(self, method, path, body=None):
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                headers = {"Content-Type": "application/json"} if body is not None else {}
+                self.connection.request(method, self.prefix + path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+    def get_json(self, path):
+        status, data = self.request("GET", path)
+        if status != 200:
+            raise RuntimeError(f"GET {path} returned {status}")
+        return json.loads(data)
+
+
+#id -> props of every component with an id in the layout
+def layout_components(node, components=None):
+    components = {} if components is None else components
+    if isinstance(node, dict):
+        props = node.get("props", {})
+        if "id" in props and isinstance(props["id"], str):
+            components[props["id"]] = props
+        for value in props.values():
+            layout_components(value, components)
+    elif isinstance(node, list):
+        for item in node:
+            layout_components(item, components)
+    return components
+
+
+#Values a visitor can choose for a dropdown or slider
+def input_options(props):
+    if "options" in props:
+        return [option["value"] if isinstance(option, dict) else option for option in props["options"]]
+    if "marks" in props:
+        return [int(mark) if str(mark).isdigit() else mark for mark in props["marks"]]
+    return [props.get("value")]
+
+
+class Dashboard:
+    def __init__(self, client):
+        components = layout_components(client.get_json("/_dash-layout"))
+        #clientside callbacks run in the browser and are not replayed
+        self.callbacks = [callback for callback in client.get_json("/_dash-dependencies") if not callback.get("clientside_function")]
+        ids = {item["id"] for callback in self.callbacks for item in callback["inputs"] + callback["state"]}
+        self.values = {id: components[id].get("value") for id in ids if id in components}
+        self.options = {id: input_options(components[id]) for id in ids if id in components and "value" in components[id]}
+        self.controls = sorted(id for id in self.options if len(self.options[id]) > 1)
+
+    def payload(self, callback, values, changed):
+        def items(dependencies):
+            return [dict(item, value=values.get(item["id"])) for item in dependencies]
+        output_id, output_property = callback["output"].rsplit(".", 1)
+        return json.dumps({"output": callback["output"],
+                           "outputs": {"id": output_id, "property": output_property},
+                           "inputs": items(callback["inputs"]),
+                           "changedPropIds": [f"{changed}.value"] if changed else [],
+                           "state": items(callback["state"])})
+
+    def triggered_by(self, control):
+        return [callback for callback in self.callbacks if any(item["id"] == control for item in callback["inputs"])]
+
+
+#A visitor: loads the page (all callbacks fire once), then changes one control after another
+def virtual_user(url, dashboard, deadline, seed, think_time, results, lock):
+    client = Client(url)
+    rng = random.Random(seed)
+    values = dict(dashboard.values)
+    pending = [(callback, None) for callback in dashboard.callbacks]
+    while time.perf_counter() < deadline:
+        if not pending:
+            control = rng.choice(dashboard.controls)
+            values[control] = rng.choice(dashboard.options[control])
+            pending = [(callback, control) for callback in dashboard.triggered_by(control)]
+        callback, changed = pending.pop(0)
+        start = time.perf_counter()
+        try:
+            status, data = client.request("POST", "/_dash-update-component", dashboard.payload(callback, values, changed))
+        except (OSError, http.client.HTTPException):
+            status, data = None, b""
+        duration = time.perf_counter() - start
+        with lock:
+            results.append((callback["output"], duration, status, len(data)))
+        if think_time and not pending:
+            time.sleep(rng.expovariate(1 / think_time))
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def report(results, elapsed, users, workers):
+    print(f"{len(results)} requests in {elapsed:.1f}s with {users} users" + (f" against {workers} workers" if workers else ""))
+    print(f"{'callback':<32}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'KB/resp':>9}")
+    outputs = sorted({output for output, _, _, _ in results})
+    for output in outputs + ["all"]:
+        rows = [row for row in results if output in ("all", row[0])]
+        durations = sorted(duration for _, duration, status, _ in rows if status == 200)
+        errors = sum(status != 200 for _, _, status, _ in rows)
+        size = sum(size for _, _, _, size in rows) / max(1, len(rows)) / 1024
+        print(f"{output:<32}{len(rows):>9}{errors:>8}" + "".join(f"{percentile(durations, p) * 1000:>9.1f}" for p in (50, 95, 99)) + f"{size:>9.1f}")
+    print(f"throughput {sum(status == 200 for _, _, status, _ in results) / elapsed:.1f} requests/s")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+#Start the dashboard under gunicorn and wait until it answers
+def spawn_gunicorn(workers, threads, mode="shared", timeout=300):
+    port = free_port()
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "dash_app:server", "--workers", str(workers),
+                                "--threads", str(threads), "--bind", f"127.0.0.1:{port}"] + MODES[mode], cwd=ROOT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            Client(url, timeout=5).get_json("/_dash-layout")
+            return process, url
+        except (OSError, RuntimeError, http.client.HTTPException):
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start in time")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay dashboard interactions against _dash-update-component and report latency percentiles")
+    parser.add_argument("--url", default="http://127.0.0.1:8050", help="dashboard to test (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="start the dashboard under gunicorn for the test")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers with --spawn")
+    parser.add_argument("--threads", type=int, default=1, help="gunicorn threads per worker with --spawn")
+    parser.add_argument("--mode", choices=list(MODES), default="shared", help="how the workers get their data with --spawn")
+    parser.add_argument("--users", type=int, default=4, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--think-time", type=float, default=0, help="mean pause in seconds between interactions of a user")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if args.spawn:
+        process, url = spawn_gunicorn(args.workers, args.threads, args.mode)
+    try:
+        dashboard = Dashboard(Client(url))
+        results, lock = [], threading.Lock()
+        start = time.perf_counter()
+        deadline = start + args.duration
+        users = [threading.Thread(target=virtual_user, args=(url, dashboard, deadline, args.seed + i, args.think_time, results, lock))
+                 for i in range(args.users)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        report(results, time.perf_counter() - start, args.users, f"{args.workers} {args.mode}" if args.spawn else None)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
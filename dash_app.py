@@ -1,81 +1,89 @@
-import pandas as pd
-import geopandas as gpd
+import os
+
+import numpy as np
 import plotly.express as px
 
-from dash import Dash, dcc, html, Input, Output 
+from dash import Dash, dcc, html, Input, Output, State, ClientsideFunction
 import dash_bootstrap_components as dbc
+from flask import abort, jsonify
 
-#Function to add zeros from the beginning of key_1. They are removed automatically while loading from excel file
-def add_zeros_key_1_no_index(df):
-    df = df.reset_index(inplace=False)
-    df["key_1"] = df["key_1"].apply(lambda x: "0"+str(x) if len(str(x))<6 else str(x))
-    return df
+import geometry_cache
+import shared_data
+import figure_cache
+import instrumentation
+import output_optimisation
 
 #Loading all data needed for the dashboard
 
-#load data from saved excel files (f.ex. data scaled by population) with index
-df = pd.read_excel("Data/df_merged.xlsx", index_col = [0,1,2])
-df_per_area = pd.read_excel("Data/df_by_area.xlsx", index_col = [0,1,2])
-df_per_pop = pd.read_excel("Data/df_by_population.xlsx", index_col = [0,1,2])
-
-#zeros are removed from the beginning key_1 when loading from excel file. They needed to be added again.
-df = add_zeros_key_1_no_index(df)
-df_per_area = add_zeros_key_1_no_index(df_per_area)
-df_per_pop = add_zeros_key_1_no_index(df_per_pop)
-
-#importing and cleaning Berlin Bezirksregionen spatial data
-Bezirksregionen_spatial = gpd.read_file("./Data/LOR/lor_shp_2019/Bezirksregion_EPSG_25833.shp")
-Bezirksregionen_spatial.crs = "epsg:25833"
-Bezirksregionen_spatial = Bezirksregionen_spatial.to_crs(epsg=4326)
-Bezirksregionen_spatial = Bezirksregionen_spatial.rename(columns={'SCHLUESSEL': 'key_2'})
-Bezirksregionen_spatial = Bezirksregionen_spatial[['key_2', 'geometry']]
-
-#importing and cleaning df_keys
-df_keys = pd.read_excel("Data/df_keys.xlsx", index_col = [0])
-for key in ["key_1", "key_2"]:
-    df_keys[key] = df_keys[key].apply(lambda x: "0"+str(x) if len(str(x))<6 else str(x))
-
-#merging spatial data with df_keys on key_2
-Bezirksregionen_spatial = pd.merge(Bezirksregionen_spatial, df_keys, on = ['key_2', 'key_2'])
-df_spatial = Bezirksregionen_spatial.dissolve(by='key_1')
-df_spatial.reset_index(inplace=True)
-
-#simplify geometry to run dashboard choropleth map faster
-df_spatial["geometry"] = df_spatial["geometry"].simplify(1)
-
-#merging spatial data with df on key_1
-df_spatial_temp = df_spatial.copy()
-df_spatial = pd.merge(df_spatial, df, on = ['key_1', 'key_1'])
-df_spatial_per_pop = pd.merge(df_spatial_temp, df_per_pop, on = ['key_1', 'key_1'])
-df_spatial_per_area = pd.merge(df_spatial_temp, df_per_area, on = ['key_1', 'key_1'])
-
-#load prediction data from saved excel files with index
-df_pred_prophet = pd.read_excel("Data/df_prophet_predictions.xlsx", index_col = [0,1,2])
-
-#load Random Forest algorithm's feature_importances
-#df_RF_feature_importances = pd.read_excel("Data/df_RF_feature_importances.xlsx", index_col = [0])
-df_RF_feature_importances = pd.read_excel("Data/H20AutoML_treemodels_importances.xlsx", index_col = [0])
+#Under gunicorn -c gunicorn.conf.py the master has already built the query layer and the map geometry in shared memory,
+#the workers attach to it instead of loading the tables. Otherwise the tables are loaded here.
+#The duration of every startup stage is exposed at /metrics
+shared = shared_data.attach_from_environment()
+if shared is None:
+    tables, geometry_json, crime_queries = shared_data.load_dashboard_data()
+    df = tables["df_merged"]
+    df_per_area = tables["df_by_area"]
+    df_per_pop = tables["df_by_population"]
+
+    #df_keys with zero-padded key_1 and key_2
+    df_keys = tables["df_keys"]
+
+    #prediction data with index (key_1, Bezirksregion, year)
+    df_pred_prophet = tables["df_prophet_predictions"]
+
+    #H2O AutoML best tree model's feature_importances
+    df_RF_feature_importances = tables["feature_importances"]
+
+    # The layout and callbacks only read the loaded dataframes, so no copies are made
+    dff = df
+    dff_predictions = df_pred_prophet
+else:
+    crime_queries, geometry_json = shared
+
+#The geometry URL carries the digest of the GeoJSON, so browsers can cache it until it changes
+geometry_etags = {level: output_optimisation.digest(data) for level, data in geometry_json.items()}
+map_geometry_level = os.environ.get("MAP_GEOMETRY_LEVEL", geometry_cache.DEFAULT_LEVEL)
+map_geometry_url = f"/geometry/{map_geometry_level}.geojson?v={geometry_etags[map_geometry_level]}"
+
+#"server" rebuilds the map figure on the server for every change, "clientside" sends the geometry once and
+#afterwards only the values of the selected variable, which the browser applies to the map when the year changes
+map_mode = os.environ.get("MAP_MODE", "server")
 
 #Create Dashboard with Plotly Express and Dash Bootstrap Components
 
-# Make copies of the original dataframes
-dff = df_spatial.copy()
-dff_per_pop = df_spatial_per_pop.copy()
-dff_per_area = df_spatial_per_area.copy()
-dff_predictions = df_pred_prophet.copy()
+#All figures use the slim dark "dashboard" template with transparent backgrounds
+output_optimisation.register_template()
 
 # Define a list of names for the different dataframes
 df_names = ["Total", "Per capita", "Per square kilometer"]
 
 # Get a list of dictionaries of the "Bezirksregion" names
-Bezirksregionen_names = [{"label": region, "value": region} for region in dff_predictions.index.get_level_values('Bezirksregion').unique()]
+Bezirksregionen_names = [{"label": region, "value": region} for region in dict.fromkeys(crime_queries.regions)]
 
 # Define a list of variables to be used in the dropdown menus, excluding certain variables
-excluded_variables = ["Total Population", "Area in square kilometers", "key_1", "geometry", "key_2", "year", "Bezirksregion"]
-variable_names = [{"label": var, "value": var} for var in dff.columns if var not in excluded_variables]
+variable_names = [{"label": var, "value": var} for var in crime_queries.variables]
+
+# The first 17 variables are the types of crime, the first of them being "Straftaten insgesamt"
+crime_types = crime_queries.crime_types
+
+# Years of the sliders
+years = crime_queries.years
 
 app = Dash(__name__, external_stylesheets=[dbc.themes.LUX])
 server = app.server
+instrumentation.register(server)
+#Compressed responses and caching headers for the assets
+output_optimisation.register(server)
+
+# Serve the cached choropleth geometry once so map figures only reference it by URL
+@server.route("/geometry/<level>.geojson")
+def serve_geometry(level):
+    if level not in geometry_json:
+        abort(404)
+    #geometry attached from shared memory is a memoryview of the segment
+    data = geometry_json[level]
+    return output_optimisation.cacheable_response(bytes(data) if isinstance(data, memoryview) else data,
+                                                  "application/geo+json", geometry_etags[level])
 
 title = dcc.Markdown(children = "Berlin Crime Dashboard", style={'color': 'white', 'text-align': 'center'})
 
@@ -97,11 +105,11 @@ dropdown_region_top = dcc.Dropdown(id="slct_dropdown_region_top",
 
 pie_top_region = dcc.Graph(id='fig_pie_top_region',style={'display': 'inline-block'})
 
-slider_top_region = dcc.Slider(min=dff['year'].min(),
-                        max=dff['year'].max(),
+slider_top_region = dcc.Slider(min=min(years),
+                        max=max(years),
                         step=None,
-                        value=dff['year'].max(),
-                        marks={str(year): str(year) for year in dff['year'].unique()},
+                        value=max(years),
+                        marks={str(year): str(year) for year in years},
                         id='slct_slider_top_region')
 
 dropdown_type_top = dcc.Dropdown(id="slct_dropdown_type_top",
@@ -115,11 +123,11 @@ dropdown_type_top = dcc.Dropdown(id="slct_dropdown_type_top",
 
 barchart_top_type = dcc.Graph(id='fig_barchart_top_type',style={'display': 'inline-block'})
 
-slider_top_type = dcc.Slider(min=dff['year'].min(),
-                        max=dff['year'].max(),
+slider_top_type = dcc.Slider(min=min(years),
+                        max=max(years),
                         step=None,
-                        value=dff['year'].max(),
-                        marks={str(year): str(year) for year in dff['year'].unique()},
+                        value=max(years),
+                        marks={str(year): str(year) for year in years},
                         id='slct_slider_top_type')
 
 
@@ -177,11 +185,22 @@ dropdown_type_map = dcc.Dropdown(id="slct_dropdown_type_map",
             
 graph_map = dcc.Graph(id='fig_map', figure={}, style={})
 
-slider_map = dcc.Slider(min=dff['year'].min(),
-                        max=dff['year'].max(),
+# Values of the selected map variable for every year and region, only used with MAP_MODE=clientside
+map_values_store = dcc.Store(id='map_values')
+
+# The figure template is sent once with the page, the server callbacks write their figures without it into a store per
+# graph and assets/figure_template.js adds the template on the way to the graph
+template_graphs = ['fig_pie_top_region', 'fig_barchart_top_type', 'fig_barchart_prediction', 'fig_pie_RF_importance']
+if map_mode != "clientside":
+    template_graphs.append('fig_map')
+figure_stores = [dcc.Store(id='figure_template', data=output_optimisation.template_json())] + \
+                [dcc.Store(id=f'{graph}_data') for graph in template_graphs]
+
+slider_map = dcc.Slider(min=min(years),
+                        max=max(years),
                         step=None,
-                        value=dff['year'].max(),
-                        marks={str(year): str(year) for year in dff['year'].unique()},
+                        value=max(years),
+                        marks={str(year): str(year) for year in years},
                         id='slct_slider_map')
 
 app.layout = html.Div(dbc.Card(dbc.CardBody([dbc.Row([title]), 
@@ -222,9 +241,9 @@ app.layout = html.Div(dbc.Card(dbc.CardBody([dbc.Row([title]),
                                                  dbc.Col([], width = 6),
                                              ]),
                                              dbc.Row([
-                                                 dbc.Col([pie_RF_importance], width = 5),                                                
-                                                 dbc.Col([], width = 1),
                                                  dbc.Col([graph_barchart_prediction], width = 5),
+                                                 dbc.Col([], width = 1),
+                                                 dbc.Col([pie_RF_importance], width = 5),
                                              ]),
                                              html.Br(),
                                              dbc.Row([
@@ -242,127 +261,174 @@ app.layout = html.Div(dbc.Card(dbc.CardBody([dbc.Row([title]),
                                                  dbc.Col([dropdown_type_map], width = 5),
                                                  dbc.Col([], width = 3),
                                              ]),
-                                             dbc.Row([graph_map]),
+                                             dbc.Row([graph_map, map_values_store]),
+                                             dbc.Row(figure_stores),
                                              dbc.Row([
                                                  dbc.Col([], width = 2),
                                                  dbc.Col([slider_map], width = 7)]),
                                                  dbc.Col([], width = 2),
                                              ]), color = 'black',),)
 
-# Connect the Plotly graphs with Dash Components
-@app.callback(
-    [Output('fig_pie_top_region', 'figure'),
-            Output('fig_barchart_top_type', 'figure'),
-            Output('fig_pie_RF_importance', 'figure'),
-            Output('fig_barchart_prediction', 'figure'),
-            Output('fig_map', 'figure')],
-    
-    [Input('slct_dropdown_region_top', 'value'), Input('slct_slider_top_region', 'value'),
-         Input('slct_dropdown_type_top', 'value'), Input('slct_slider_top_type', 'value'),
-         Input('slct_dropdown_region_pred', 'value'), Input('slct_dropdown_type_pred', 'value'), Input('slct_dropdown_type_RF_importance', 'value'),
-         Input('slct_dropdown_df_map', 'value'), Input('slct_dropdown_type_map', 'value'), Input('slct_slider_map', 'value')]
-)
-def update_graph(slct_dropdown_region_top, slct_slider_top_region,
-                 slct_dropdown_type_top, slct_slider_top_type,
-                 slct_dropdown_region_pred, slct_dropdown_type_pred, slct_dropdown_type_RF_importance,
-                 slct_dropdown_df_map, slct_dropdown_type_map, slct_slider_map):
-    
-    # Make a copy of the dataframes
-    dff = df_spatial.copy()
-    dff_per_pop = df_spatial_per_pop.copy()
-    dff_per_area = df_spatial_per_area.copy()
-    dff_predictions = df_pred_prophet.copy()
-    dff_RF_feature_imp = df_RF_feature_importances.copy().T
-
-    #Select data for top region pie chart
-    dff_top_region_columns = dff[dff["year"] == slct_slider_top_region][dff["Bezirksregion"] == slct_dropdown_region_top].columns.values.tolist()[6:22]
-    dff_top_region = dff[dff["year"] == slct_slider_top_region][dff["Bezirksregion"] == slct_dropdown_region_top].iloc[:,6:22].iloc[:1].values.flatten().tolist()
-    srs = pd.Series(dff_top_region)
-    top_idx = srs.nlargest(5).index.values.tolist()
-    remaining_idx = srs.nsmallest(11).index.values.tolist()
-    remaining_sum = sum(srs[remaining_idx])
-    values_pie = srs[top_idx].tolist()+[remaining_sum]
-    names_pie = [dff_top_region_columns[i] for i in top_idx]+['Remaining']
+# Each figure is built by its own callback from its own inputs only
+
+#top region pie chart
+def update_pie_top_region(slct_dropdown_region_top, slct_slider_top_region):
+    with instrumentation.phase("query"):
+        dff_top_region_columns = crime_types[1:]
+        dff_top_region = crime_queries.region_values(slct_slider_top_region, slct_dropdown_region_top, dff_top_region_columns)
+        order = np.argsort(-dff_top_region, kind="stable")
+        top_idx = order[:5]
+        remaining_sum = dff_top_region[order[5:]].sum()
+        values_pie = dff_top_region[top_idx].tolist()+[remaining_sum]
+        names_pie = [dff_top_region_columns[i] for i in top_idx]+['Remaining']
+
+    with instrumentation.phase("figure"):
+        fig1 = px.pie(values=values_pie, names=names_pie, color_discrete_sequence=px.colors.sequential.RdBu)
+    with instrumentation.phase("layout"):
+        fig1.update_layout(autosize=False, width=600, height=470,)
+        fig1.update_traces(textposition='inside', textinfo='percent')
+        fig1.update_traces(pull=[0, 0, 0, 0, 0, 0.1])
+    return fig1
+
+#highest crime rate bar chart
+def update_barchart_top_type(slct_dropdown_type_top, slct_slider_top_type):
+    with instrumentation.phase("query"):
+        top_type_regions, top_type_values = crime_queries.top_regions(slct_slider_top_type, slct_dropdown_type_top, 10)
+
+    with instrumentation.phase("figure"):
+        fig2 = px.bar(x = top_type_regions,
+                      y = top_type_values,
+                      labels={'y': slct_dropdown_type_top})
+    with instrumentation.phase("layout"):
+        fig2.update_traces(hovertemplate = "District: %{x} <br>Value: %{y}")
+        fig2.update_xaxes(title_text = '')
+        fig2.update_layout(autosize=False, width=600, height=470,)
+        fig2.update_traces(marker_color='darkgreen')
+    return fig2
+
+#predictions bar chart
+def update_barchart_prediction(slct_dropdown_region_pred, slct_dropdown_type_pred):
+    with instrumentation.phase("query"):
+        pred_years = crime_queries.pred_years
+        pred_values = crime_queries.region_predictions(slct_dropdown_region_pred, slct_dropdown_type_pred)
+
+    with instrumentation.phase("figure"):
+        fig3 = px.bar(x = pred_years,
+                     y = pred_values,
+                     color = ["actual" if year <= crime_queries.years[-1] else 'forecast' for year in pred_years],
+                     color_discrete_map={
+                         'actual': 'darkgreen',
+                         'forecast': 'darkred'},
+                     labels={'x': 'Year', 'y': slct_dropdown_type_pred})
+    with instrumentation.phase("layout"):
+        fig3.update_traces(hovertemplate = "Year: %{x} <br>Value: %{y}")
+        fig3.update_layout(showlegend=True)
+        fig3.update_layout(autosize=False, width=600, height=400,)
+    return fig3
+
+#feature importance pie chart
+def update_pie_RF_importance(slct_dropdown_type_RF_importance):
+    with instrumentation.phase("query"):
+        top_features = crime_queries.top_features(slct_dropdown_type_RF_importance)
+
+    with instrumentation.phase("figure"):
+        fig4 = px.pie(values=top_features, names=top_features.index, color_discrete_sequence=px.colors.sequential.RdBu)
+    with instrumentation.phase("layout"):
+        fig4.update_layout(autosize=False, width=600, height=470,)
+        fig4.update_traces(textposition='inside', textinfo='percent')
+        fig4.update_traces(pull=[0, 0, 0, 0, 0, 0.1])
+    return fig4
+
+#choropleth map
+def update_map(slct_dropdown_df_map, slct_dropdown_type_map, slct_slider_map):
+    with instrumentation.phase("query"):
+        map_values = crime_queries.value_vector(slct_dropdown_df_map, slct_slider_map, slct_dropdown_type_map)
+
+    with instrumentation.phase("figure"):
+        fig5 = px.choropleth(geojson=map_geometry_url,
+                            featureidkey="id",
+                            locations = crime_queries.key_1,
+                            color = map_values,
+                            labels={'color': slct_dropdown_type_map},
+                            height=500,
+                            color_continuous_scale="Hot",
+                            hover_name = crime_queries.regions)  
     
-    # Select data for the feature importance pie chart
-    dff_RF_feature_imp = dff_RF_feature_imp[slct_dropdown_type_RF_importance]
-    top_features = dff_RF_feature_imp.nlargest(5)
-    top_features["remaining"] = 1-sum(top_features)
-
-    # Select data for top type bar chart
-    dff_top_type = dff[dff["year"] == slct_slider_top_type].nlargest(10, slct_dropdown_type_top)
-
-    # Select data for prediction bar chart
-    dff_pred_region = dff_predictions[dff_predictions.index.get_level_values("Bezirksregion") == slct_dropdown_region_pred]
-
-    # Select data for choropleth map
-    dff_map_year = dff[dff["year"] == slct_slider_map][slct_dropdown_type_map]  
-    dff_per_pop_map_year = dff_per_pop[dff_per_pop["year"] == slct_slider_map][slct_dropdown_type_map] 
-    dff_per_area_map_year = dff_per_area[dff_per_area["year"] == slct_slider_map][slct_dropdown_type_map] 
-    dfs = {"Total": dff_map_year, "Per capita": dff_per_pop_map_year, "Per square kilometer": dff_per_area_map_year}
-
-    #top region pie chart
-    fig1 = px.pie(values=values_pie, names=names_pie, color_discrete_sequence=px.colors.sequential.RdBu)
-    fig1.update_layout(autosize=False, width=600, height=470,)
-    fig1.update_layout(template='plotly_dark',
-                        plot_bgcolor= 'rgba(0, 0, 0, 0)',
-                        paper_bgcolor= 'rgba(0, 0, 0, 0)',)
-    fig1.update_traces(textposition='inside', textinfo='percent')
-    fig1.update_traces(pull=[0, 0, 0, 0, 0, 0.1])
-
-    #highest crime rate bar chart
-    fig2 = px.bar(dff_top_type,
-                  x = dff_top_type["Bezirksregion"],
-                  y = slct_dropdown_type_top,)
-    fig2.update_traces(hovertemplate = "District: %{x} <br>Value: %{y}")
-    fig2.update_xaxes(title_text = '')
-    fig2.update_layout(template='plotly_dark',
-                        plot_bgcolor= 'rgba(0, 0, 0, 0)',
-                        paper_bgcolor= 'rgba(0, 0, 0, 0)',)
-    fig2.update_layout(autosize=False, width=600, height=470,)
-    fig2.update_traces(marker_color='darkgreen')
-
-    #predictions bar chart
-    fig3 = px.bar(dff_pred_region,
-                 x = dff_pred_region.index.get_level_values('year').unique(),
-                 y = slct_dropdown_type_pred,
-                 color = (["actual"]*9)+(['forecast']*5),
-                 color_discrete_map={
-                     'actual': 'darkgreen',
-                     'forecast': 'darkred'},
-                 labels={'x': 'Year'})
-    fig3.update_traces(hovertemplate = "Year: %{x} <br>Value: %{y}")
-    fig3.update_layout(showlegend=True)
-    fig3.update_layout(template='plotly_dark',
-                       plot_bgcolor= 'rgba(0, 0, 0, 0)',
-                       paper_bgcolor= 'rgba(0, 0, 0, 0)',)
-    fig3.update_layout(autosize=False, width=600, height=400,)
-    
-    #feature importance pie chart
-    fig4 = px.pie(values=top_features, names=top_features.index, color_discrete_sequence=px.colors.sequential.RdBu)
-    fig4.update_layout(autosize=False, width=600, height=470,)
-    fig4.update_layout(template='plotly_dark',
-                        plot_bgcolor= 'rgba(0, 0, 0, 0)',
-                        paper_bgcolor= 'rgba(0, 0, 0, 0)',)
-    fig4.update_traces(textposition='inside', textinfo='percent')
-    fig4.update_traces(pull=[0, 0, 0, 0, 0, 0.1])
-    
-    #choropleth map
-    fig5 = px.choropleth(dfs[slct_dropdown_df_map],
-                        geojson=dff.geometry,
-                        locations = dfs[slct_dropdown_df_map].index,
-                        color = slct_dropdown_type_map,
-                        height=500,
-                        color_continuous_scale="Hot",
-                        hover_name = dff[dff['year'] == slct_slider_map]["Bezirksregion"])  
-    
-    fig5.update_geos(fitbounds="locations",
-                    visible=True)
-    fig5.update_layout(template='plotly_dark',
-                        plot_bgcolor= 'rgba(0, 0, 0, 0)',
-                        paper_bgcolor= 'rgba(0, 0, 0, 0)',)
-        
-    return fig1, fig2, fig3, fig4, fig5
+    with instrumentation.phase("layout"):
+        fig5.update_traces(hovertemplate = "District: %{hovertext} <br>%{meta}: %{z}<extra></extra>", meta = slct_dropdown_type_map)
+        fig5.update_geos(fitbounds="locations",
+                        visible=True)
+        fig5.update_layout(uirevision='map')
+    return fig5
+
+#values of a map variable for all years as a compact array, applied to the map in the browser (assets/map_restyle.js)
+def update_map_values(slct_dropdown_df_map, slct_dropdown_type_map):
+    with instrumentation.phase("query"):
+        matrix = crime_queries.value_matrix(slct_dropdown_df_map, slct_dropdown_type_map)
+    return {"variable": slct_dropdown_type_map,
+            "years": crime_queries.years,
+            "values": [[None if np.isnan(value) else float(f"{value:.6g}") for value in row] for row in matrix]}
+
+# Every combination of inputs of each figure callback, used to prerender the figure cache
+def figure_input_space():
+    years = crime_queries.years
+    regions = list(crime_queries.region_index)
+    return [(cached_pie_top_region, [(region, year) for region in regions for year in years]),
+            (cached_barchart_top_type, [(crime_type, year) for crime_type in crime_types for year in years]),
+            (cached_barchart_prediction, [(region, crime_type) for region in regions for crime_type in crime_types]),
+            (cached_pie_RF_importance, [(crime_type,) for crime_type in crime_types]),
+            (cached_map, [(view, variable, year) for view in df_names for variable in crime_queries.variables for year in years])]
+
+# Figures are served from a size-bounded LRU cache of their JSON, configured with the FIGURE_CACHE* environment variables
+#The figures are built with the template from the query layer by the update_* functions and embed the geometry URL, the
+#cached figures are invalidated when any of them changes. Increase FIGURE_CODE_VERSION with every change of an update_* function.
+#They are cached and sent without the template, the browser adds it
+FIGURE_CODE_VERSION = 1
+fig_cache = figure_cache.from_environment(version=output_optimisation.figure_version(map_geometry_url, crime_queries.digest(),
+                                                                                     FIGURE_CODE_VERSION))
+cached_pie_top_region = fig_cache.cached(output_optimisation.without_template(update_pie_top_region))
+cached_barchart_top_type = fig_cache.cached(output_optimisation.without_template(update_barchart_top_type))
+cached_barchart_prediction = fig_cache.cached(output_optimisation.without_template(update_barchart_prediction))
+cached_pie_RF_importance = fig_cache.cached(output_optimisation.without_template(update_pie_RF_importance))
+cached_map = fig_cache.cached(output_optimisation.without_template(update_map))
+
+if os.environ.get("FIGURE_CACHE_WARM") == "1":
+    with instrumentation.startup_stage("figure_cache_warm"):
+        fig_cache.warm(figure_input_space())
+
+# Hit, miss and eviction counters to size the figure cache
+@server.route("/figure-cache/stats")
+def figure_cache_stats():
+    return jsonify(fig_cache.stats())
+
+# Connect the Plotly graphs with Dash Components
+# The update_* functions stay plain python functions so they can be called directly, f.ex. by the benchmarks.
+# The registered callbacks are instrumented, so their duration and the duration of their phases show up at /metrics
+app.callback(Output('fig_pie_top_region_data', 'data'),
+             Input('slct_dropdown_region_top', 'value'), Input('slct_slider_top_region', 'value'))(instrumentation.instrumented(cached_pie_top_region))
+app.callback(Output('fig_barchart_top_type_data', 'data'),
+             Input('slct_dropdown_type_top', 'value'), Input('slct_slider_top_type', 'value'))(instrumentation.instrumented(cached_barchart_top_type))
+app.callback(Output('fig_barchart_prediction_data', 'data'),
+             Input('slct_dropdown_region_pred', 'value'), Input('slct_dropdown_type_pred', 'value'))(instrumentation.instrumented(cached_barchart_prediction))
+app.callback(Output('fig_pie_RF_importance_data', 'data'),
+             Input('slct_dropdown_type_RF_importance', 'value'))(instrumentation.instrumented(cached_pie_RF_importance))
+
+if map_mode == "clientside":
+    # The map figure with the geometry reference and the template is sent once, afterwards only the values change
+    graph_map.figure = output_optimisation.with_template(cached_map(dropdown_df_map.value, dropdown_type_map.value, slider_map.value))
+    app.callback(Output('map_values', 'data'),
+                 Input('slct_dropdown_df_map', 'value'), Input('slct_dropdown_type_map', 'value'))(instrumentation.instrumented(update_map_values))
+    app.clientside_callback(ClientsideFunction(namespace='map', function_name='restyle'),
+                            Output('fig_map', 'figure'),
+                            Input('map_values', 'data'), Input('slct_slider_map', 'value'), State('fig_map', 'figure'))
+else:
+    app.callback(Output('fig_map_data', 'data'),
+                 Input('slct_dropdown_df_map', 'value'), Input('slct_dropdown_type_map', 'value'), Input('slct_slider_map', 'value'))(instrumentation.instrumented(cached_map))
+
+for graph in template_graphs:
+    app.clientside_callback(ClientsideFunction(namespace='template', function_name='apply'),
+                            Output(graph, 'figure'),
+                            Input(f'{graph}_data', 'data'), State('figure_template', 'data'))
 
 if __name__ == '__main__':
     app.run_server(host="127.0.0.1", debug=True, port=8044)
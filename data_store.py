@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import hashlib
+
+import pandas as pd
+
+#Columnar data store for the dashboard tables
+#The Excel files are parsed once by `python data_store.py` and written to Parquet with key_1/key_2 stored as
+#zero-padded strings, so the dashboard no longer has to parse Excel or repair the keys at startup
+
+STORE_DIR = "Data/store"
+MANIFEST_PATH = os.path.join(STORE_DIR, "manifest.json")
+
+#Excel source and index columns of every table the dashboard loads
+EXCEL_SOURCES = {"df_merged": ("Data/df_merged.xlsx", [0, 1, 2]),
+                 "df_by_area": ("Data/df_by_area.xlsx", [0, 1, 2]),
+                 "df_by_population": ("Data/df_by_population.xlsx", [0, 1, 2]),
+                 "df_prophet_predictions": ("Data/df_prophet_predictions.xlsx", [0, 1, 2]),
+                 "df_keys": ("Data/df_keys.xlsx", [0]),
+                 "feature_importances": ("Data/H20AutoML_treemodels_importances.xlsx", [0])}
+
+#Tables whose index (key_1, year, Bezirksregion) is turned into columns for the dashboard
+FLAT_TABLES = ["df_merged", "df_by_area", "df_by_population"]
+
+
+#Zeros are removed from the beginning of the keys when loading from excel file. They are added again in one vectorized step
+def pad_keys(df, keys=("key_1", "key_2")):
+    for key in keys:
+        if key in df.columns:
+            df[key] = df[key].astype(str).str.zfill(6)
+    return df
+
+
+#Pad key_1 inside the index of the prediction frame (key_1, Bezirksregion, year)
+def pad_index_key_1(df):
+    df = df.reset_index()
+    df = pad_keys(df, keys=("key_1",))
+    return df.set_index(["key_1", "Bezirksregion", "year"])
+
+
+#Content hash of a file, used to detect stale store entries
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+#Read a single table from its Excel source and bring it into the shape the dashboard uses
+def read_excel_table(name):
+    path, index_col = EXCEL_SOURCES[name]
+    df = pd.read_excel(path, index_col=index_col)
+    if name in FLAT_TABLES:
+        df = pad_keys(df.reset_index())
+    elif name == "df_prophet_predictions":
+        df = pad_index_key_1(df)
+    elif name == "df_keys":
+        df = pad_keys(df)
+    elif name == "feature_importances":
+        df = df.astype(float)
+    return df
+
+
+def load_excel_tables():
+    return {name: read_excel_table(name) for name in EXCEL_SOURCES}
+
+
+def store_path(name):
+    return os.path.join(STORE_DIR, name + ".parquet")
+
+
+#Parse every Excel source once and write it to the Parquet store together with a manifest of source hashes
+def build_store():
+    os.makedirs(STORE_DIR, exist_ok=True)
+    manifest = {}
+    for name, (path, _) in EXCEL_SOURCES.items():
+        df = read_excel_table(name)
+        df.to_parquet(store_path(name), engine="pyarrow", index=True)
+        manifest[name] = {"source": path, "sha256": file_digest(path)}
+        print(f"{name}: {len(df)} rows -> {store_path(name)}")
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+#The store is stale if it is missing, incomplete or any Excel source changed since it was built
+def store_is_fresh():
+    if not os.path.exists(MANIFEST_PATH):
+        return False
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+    for name, (path, _) in EXCEL_SOURCES.items():
+        entry = manifest.get(name)
+        if entry is None or not os.path.exists(store_path(name)):
+            return False
+        if os.path.exists(path) and file_digest(path) != entry["sha256"]:
+            return False
+    return True
+
+
+def load_store_tables():
+    return {name: pd.read_parquet(store_path(name), engine="pyarrow") for name in EXCEL_SOURCES}
+
+
+#Load all dashboard tables from the Parquet store, falling back to the Excel files if the store is missing or stale
+def load_tables():
+    try:
+        if store_is_fresh():
+            return load_store_tables()
+        print("Data store missing or stale, loading Excel files. Run `python data_store.py` to rebuild it.", file=sys.stderr)
+    except ImportError:
+        print("pyarrow is not installed, loading Excel files.", file=sys.stderr)
+    return load_excel_tables()
+
+
+if __name__ == '__main__':
+    build_store()
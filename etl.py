@@ -0,0 +1,440 @@
+import os
+import re
+import glob
+import json
+import time
+import hashlib
+import argparse
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import data_store
+import imputation
+import spatial_aggregation
+
+#ETL pipeline rebuilding the merged datasets of the dashboard without running the notebook
+#  python etl.py                  run all stages, reusing cached stage outputs whose inputs did not change
+#  python etl.py --stages crime   force a stage (and everything depending on it) to run again
+#Every stage's output is cached in Data/cache/etl keyed by a content hash of its input files, its code version and the
+#hashes of the stages it depends on. Sources made of one file per year additionally cache every parsed file, so adding
+#a new year's CSV only parses that file and reruns the merge. Independent source stages run in parallel.
+
+CACHE_DIR = "Data/cache/etl"
+FILE_CACHE_DIR = os.path.join(CACHE_DIR, "files")
+
+KEYS_PATH = "Data/Schlüssel.xlsx"
+CRIME_PATH = "Data/Kriminalstatistik/Fallzahlen&HZ 2012-2021.xlsx"
+POPULATION_GLOB = "Data/Einwohnerregisterstatistik/EWR*12E_Matrix.csv"
+SHOPS_PATH = "Data/Spaetis_Bars_Wettshops/Spaetis_Bars_Wettshops_2016-2019.xlsx"
+LOR_SHAPEFILE = "Data/LOR/lor_shp_2019/Bezirksregion_EPSG_25833.shp"
+LOR_SHAPEFILE_PARTS = [LOR_SHAPEFILE, "Data/LOR/lor_shp_2019/Bezirksregion_EPSG_25833.SHX", "Data/LOR/lor_shp_2019/Bezirksregion_EPSG_25833.DBF"]
+LIGHTING_GLOB = "Data/Öffentliche_Beleuchtung/*.xls"
+WOHNLAGE_GLOB = "Data/Wohnlage/WHNLAGE*_Matrix.csv"
+ACCIDENTS_GLOB = "Data/Straßenverkehrsunfälle/AfSBBB_BE_LOR_Strasse_Strassenverkehrsunfaelle_*_Datensatz.csv"
+
+#years of the merged dataset, missing years of the sources are imputed with one of imputation.METHODS
+YEARS = list(range(2012, 2021))
+IMPUTATION_METHOD = "linear"
+
+SHOPS = ['Ausschank von Getränken', 'Spiel-, Wett- und Lotteriewesen', 'Einzelhandel mit Getränken', 'Einzelhandel mit Tabakwaren']
+ACCIDENTS = ['Unfall mit Getöteten', 'Unfall mit Schwerverletzten', 'Unfall mit Leichtverletzten']
+
+
+#The data folders contain umlauts, which may be stored decomposed (NFD) on disk. Resolve a path regardless of its normalization
+def resolve(path):
+    if os.path.exists(path):
+        return path
+    resolved = ""
+    for part in path.split("/"):
+        candidate = os.path.join(resolved, part) if resolved else part
+        if not os.path.exists(candidate):
+            parent = resolved or "."
+            matches = [entry for entry in os.listdir(parent) if unicodedata.normalize("NFC", entry) == unicodedata.normalize("NFC", part)]
+            if matches:
+                candidate = os.path.join(resolved, matches[0]) if resolved else matches[0]
+        resolved = candidate
+    return resolved
+
+
+def resolve_glob(pattern):
+    directory, name = os.path.split(pattern)
+    return sorted(glob.glob(os.path.join(resolve(directory), name)))
+
+
+#Year in a file name like EWR201212E_Matrix.csv or WHNLAGE2012_Matrix.csv
+def year_of(path):
+    return int(re.search(r"(20\d\d)", os.path.basename(path)).group(1))
+
+
+#The separator of the Matrix CSV files is detected once from the header instead of sniffing the whole file with the python engine
+def read_matrix_csv(path, **kwargs):
+    with open(path, encoding=kwargs.get("encoding", "utf-8"), errors="replace") as f:
+        header = f.readline()
+    sep = ";" if header.count(";") >= header.count(",") else ","
+    return pd.read_csv(path, sep=sep, **kwargs)
+
+
+#Parse a single file once and cache the result keyed by the file's content, the reader and the reader's version
+def cached_file(path, reader, version=1):
+    key = hashlib.sha256(f"{reader.__name__}:{version}:{data_store.file_digest(path)}".encode()).hexdigest()
+    cache_path = os.path.join(FILE_CACHE_DIR, key + ".parquet")
+    if os.path.exists(cache_path):
+        return pd.read_parquet(cache_path)
+    df = reader(path)
+    os.makedirs(FILE_CACHE_DIR, exist_ok=True)
+    df.to_parquet(cache_path)
+    return df
+
+
+#Keys
+
+def stage_keys(paths):
+    # Read data from Excel file and drop unnecessary columns
+    df_keys = pd.read_excel(paths[0], skiprows=5, dtype=str)
+    df_keys.columns = ['Bezirk_key1', 'Prognoseraum_key1', 'Bezirksregion_key1', 'Planungsraum', 'Name', 'NaN', 'Bezirk_key2', 'Prognoseraum_key2', 'Bezirksregion_key2']
+    df_keys = df_keys.drop(columns=['Planungsraum', 'NaN'])
+
+    # key_1 can be used on the Kriminalstatistik, Spaetis_Bars_Wettshops datasets
+    for column in ['Bezirk_key1', 'Prognoseraum_key1', 'Bezirksregion_key1']:
+        df_keys[column] = df_keys[column].apply(lambda x: f'0{x}' if len(str(x)) < 2 else str(x))
+    df_keys['Prognoseraum_key1'] = df_keys['Prognoseraum_key1'].apply(lambda x: x[1] + x[0] if x[0] == '0' else str(x))
+    df_keys = df_keys[~df_keys['Prognoseraum_key1'].str.contains('nan')]
+    df_keys['key_1'] = df_keys['Bezirk_key1'] + df_keys['Prognoseraum_key1'] + df_keys['Bezirksregion_key1']
+
+    # key_2 can be used on Einwohnerregisterstatistik, Straßenbeleuchtung, Wohnlage, and Straßenverkehrsunfälle
+    for column in ['Bezirk_key2', 'Prognoseraum_key2', 'Bezirksregion_key2']:
+        df_keys[column] = df_keys[column].apply(lambda x: f'{int(x):02d}'.split('.')[0])
+    df_keys['key_2'] = df_keys['Bezirk_key2'] + df_keys['Prognoseraum_key2'] + df_keys['Bezirksregion_key2']
+
+    # Remove duplicates to obtain the unique merged Bezirks-, Prognoseraum-, Bezirksregion- keys
+    return df_keys[['key_1', 'key_2']].drop_duplicates().reset_index(drop=True)
+
+
+#Kriminalstatistik
+
+def crime_years(path):
+    return sorted(int(sheet.split("_")[1]) for sheet in pd.ExcelFile(path).sheet_names if sheet.startswith("Fallzahlen_"))
+
+
+#Crime statistics (Fallzahlen) of a single year
+def read_crime_year(year, path=CRIME_PATH):
+    df_Kriminalstatistik = pd.read_excel(resolve(path), "Fallzahlen_" + str(year), header=None, index_col=None)
+    # Remove first 4 and last rows (unnecessary information)
+    df_Kriminalstatistik = df_Kriminalstatistik[4:-1]
+    # Reset index and rename columns to the first row of the dataframe, drop first row
+    df_Kriminalstatistik = df_Kriminalstatistik.reset_index(drop=True).rename(columns=df_Kriminalstatistik.iloc[0])[1:]
+    # Remove rows containing "Bezirk", "Berlin", or "0000" in the "Bezeichnung (Bezirksregion)" or "LOR-Schlüssel (Bezirksregion)" columns
+    df_Kriminalstatistik = df_Kriminalstatistik[~df_Kriminalstatistik['Bezeichnung (Bezirksregion)'].str.contains("Bezirk|Berlin")]
+    df_Kriminalstatistik = df_Kriminalstatistik[~df_Kriminalstatistik['LOR-Schlüssel (Bezirksregion)'].str.contains("0000")]
+    # Clean up column names
+    df_Kriminalstatistik = df_Kriminalstatistik.rename(columns={"LOR-Schlüssel (Bezirksregion)": "key_1", "Bezeichnung (Bezirksregion)": "Bezirksregion"})
+    df_Kriminalstatistik.columns = df_Kriminalstatistik.columns.str.replace('\n', '').str.replace('-', '').str.replace(',', ', ').str.replace(',  ', ', ')
+    # change all column values to float except key_1 and Bezirksregion (str)
+    ignore = ['Bezirksregion', 'key_1']
+    df_Kriminalstatistik = (df_Kriminalstatistik.set_index(ignore, append=True).astype(float).reset_index(ignore))
+    df_Kriminalstatistik['year'] = year
+    df_Kriminalstatistik = data_store.pad_keys(df_Kriminalstatistik.reset_index(drop=True), keys=("key_1",))
+    return df_Kriminalstatistik
+
+
+def stage_crime(paths):
+    return pd.concat([read_crime_year(year, paths[0]) for year in crime_years(paths[0])], ignore_index=True)
+
+
+#Einwohnerregisterstatistik
+
+AGE_GROUPS = {'E_U1': ['E_E00_01'], 'E_1U6': ['E_E01_02', 'E_E02_03', 'E_E03_05', 'E_E05_06'],
+              'E_6U15': ['E_E06_07', 'E_E07_08', 'E_E08_10', 'E_E10_12', 'E_E12_14', 'E_E14_15'],
+              'E_15U18': ['E_E15_18'], 'E_18U25': ['E_E18_21', 'E_E21_25'],
+              'E_25U35': ['E_E25_27', 'E_E27_30', 'E_E30_35'], 'E_35U45': ['E_E35_40', 'E_E40_45'],
+              'E_45U55': ['E_E45_50', 'E_E50_55'], 'E_55U65': ['E_E55_60', 'E_E60_63', 'E_E63_65'],
+              'E_65U80': ['E_E65_67', 'E_E67_70', 'E_E70_75', 'E_E75_80'],
+              'E_80U110': ['E_E80_85', 'E_E85_90', 'E_E90_95', 'E_E95_110']}
+
+
+#RAUMID of a Planungsraum (with its leading zero removed while parsing) to the key_2 of its Bezirksregion
+def raumid_to_key_2(raumid):
+    return raumid.astype(str).str.zfill(8).str[:6]
+
+
+def read_population(path):
+    df_Einwohnerregisterstatistik = read_matrix_csv(path, decimal=',', encoding='latin1')
+    df_Einwohnerregisterstatistik = df_Einwohnerregisterstatistik.rename(columns={'RAUMID': 'key_2', 'E_E': 'E insgesamt', 'E_EM': 'männlich', 'E_EW': 'weiblich'})
+    #sum columns to get age groups
+    for key, value in AGE_GROUPS.items():
+        df_Einwohnerregisterstatistik[key] = df_Einwohnerregisterstatistik[value].sum(axis=1)
+    #drop unneccessary columns and transform remaining columns to integers except key_2
+    df_Einwohnerregisterstatistik = df_Einwohnerregisterstatistik.reindex(columns=['key_2', 'E insgesamt', 'weiblich', 'männlich'] + list(AGE_GROUPS))
+    df_Einwohnerregisterstatistik = df_Einwohnerregisterstatistik.set_index('key_2').astype(int).reset_index()
+    df_Einwohnerregisterstatistik['key_2'] = raumid_to_key_2(df_Einwohnerregisterstatistik['key_2'])
+    df_Einwohnerregisterstatistik = df_Einwohnerregisterstatistik.groupby('key_2').sum().reset_index()
+    df_Einwohnerregisterstatistik["year"] = year_of(path)
+    return df_Einwohnerregisterstatistik
+
+
+def stage_population(paths):
+    return pd.concat([cached_file(path, read_population) for path in paths], ignore_index=True)
+
+
+#Spaetis, Bars and Wettshops
+
+def read_shops(path):
+    df_Spaetis_Bars_Wettshops_2016_2019 = pd.read_excel(path, header=None, index_col=1)
+
+    # General cleanup
+    df_Spaetis_Bars_Wettshops_2016_2019 = df_Spaetis_Bars_Wettshops_2016_2019[9:].copy()
+    df_Spaetis_Bars_Wettshops_2016_2019['Bezirksregion'] = df_Spaetis_Bars_Wettshops_2016_2019.index
+    df_Spaetis_Bars_Wettshops_2016_2019.index = range(1, len(df_Spaetis_Bars_Wettshops_2016_2019) + 1)
+    df_Spaetis_Bars_Wettshops_2016_2019.columns = ['NaN'] + [f"{shop} ({year})" for year in [2019, 2016, 2017, 2018] for shop in SHOPS] + ['Bezirksregion']
+    df_Spaetis_Bars_Wettshops_2016_2019 = df_Spaetis_Bars_Wettshops_2016_2019.drop('NaN', axis=1).drop([1, 3, 4])
+    df_Spaetis_Bars_Wettshops_2016_2019 = df_Spaetis_Bars_Wettshops_2016_2019.reset_index(drop=True)[:150].drop(0, axis=0)
+    # Extract the first part of Bezirksregion as key_1
+    df_Spaetis_Bars_Wettshops_2016_2019["key_1"] = df_Spaetis_Bars_Wettshops_2016_2019["Bezirksregion"].str.split().str[0]
+    # Replace all "-" values in table with 0
+    df_Spaetis_Bars_Wettshops_2016_2019 = df_Spaetis_Bars_Wettshops_2016_2019.replace('-', 0)
+
+    # Separate the data into one block of rows for each year
+    df_Spaetis_Bars_Wettshops = []
+    for year in range(2016, 2020):
+        df_year = df_Spaetis_Bars_Wettshops_2016_2019[[f"{shop} ({year})" for shop in SHOPS] + ['key_1']].copy()
+        df_year.columns = SHOPS + ['key_1']
+        df_year['year'] = year
+        df_Spaetis_Bars_Wettshops.append(df_year)
+    return pd.concat(df_Spaetis_Bars_Wettshops).reset_index(drop=True)
+
+
+def stage_shops(paths):
+    df_Spaetis_Bars_Wettshops = read_shops(paths[0])
+    missing_years = [year for year in YEARS if year not in set(df_Spaetis_Bars_Wettshops['year'])]
+    return imputation.impute(df_Spaetis_Bars_Wettshops, 'key_1', missing_years, SHOPS, IMPUTATION_METHOD)
+
+
+#Öffentliche Beleuchtung
+
+def read_lighting(path):
+    return pd.read_excel(path)[['East', 'North']]
+
+
+#Number of street lights in every Bezirksregion and the area of the Bezirksregion in km²
+def stage_lighting(paths):
+    regions = spatial_aggregation.load_regions(paths[0])
+    lights = (cached_file(path, read_lighting) for path in paths[3:])
+    counts = spatial_aggregation.count_points(regions, lights, x='East', y='North')
+
+    # Regions without street lights are left out, as the spatial join of the notebook did
+    Beleuchtung_LOR = pd.DataFrame({'key_2': regions['SCHLUESSEL'].astype(str), 'area': regions.area / 10**6,
+                                    'num_street_lights': counts.to_numpy()})
+    Beleuchtung_LOR = Beleuchtung_LOR[Beleuchtung_LOR['num_street_lights'] > 0]
+    Beleuchtung_LOR = Beleuchtung_LOR.drop_duplicates(subset='key_2', keep='first').reset_index(drop=True)
+
+    #Street light data is only available for a single year. The number of street lights is assumed to be constant
+    return pd.concat([Beleuchtung_LOR.assign(year=year) for year in YEARS]).sort_values(['year', 'key_2']).reset_index(drop=True)
+
+
+#Wohnlage
+
+def read_wohnlage(path):
+    df_Wohnlage = read_matrix_csv(path)
+    df_Wohnlage = df_Wohnlage.rename(columns={'RAUMID': 'key_2'})
+    df_Wohnlage['key_2'] = raumid_to_key_2(df_Wohnlage['key_2'])
+    columns = ['WLEINFoL', 'WLEINFmL', 'WLMIToL', 'WLMITmL', 'WLGUToL', 'WLGUTmL', 'WLNZORD']
+    df_Wohnlage = df_Wohnlage.groupby('key_2')[columns].sum().reset_index()
+    df_Wohnlage['year'] = year_of(path)
+
+    #combine "mit Lärm" and "ohne Lärm" for each Bezirksregion
+    df_Wohnlage['WLEINF'] = df_Wohnlage['WLEINFoL'] + df_Wohnlage['WLEINFmL']
+    df_Wohnlage['WLMIT'] = df_Wohnlage['WLMIToL'] + df_Wohnlage['WLMITmL']
+    df_Wohnlage['WLGUT'] = df_Wohnlage['WLGUToL'] + df_Wohnlage['WLGUTmL']
+    return df_Wohnlage[["key_2", "year", "WLEINF", "WLMIT", "WLGUT", "WLNZORD"]]
+
+
+def stage_wohnlage(paths):
+    return pd.concat([cached_file(path, read_wohnlage) for path in paths], ignore_index=True)
+
+
+#Straßenverkehrsunfälle
+
+#Number of accidents of each category in every Bezirksregion. Files without the pre-2021 LOR column are skipped
+def read_accidents(path):
+    df_Straßenverkehrsunfaelle = read_matrix_csv(path, encoding='latin-1')
+    if 'LOR' not in df_Straßenverkehrsunfaelle.columns:
+        return pd.DataFrame(columns=['key_2'] + ACCIDENTS + ['year'])
+    df_Straßenverkehrsunfaelle = df_Straßenverkehrsunfaelle.dropna(subset=['LOR'])
+    key_2 = df_Straßenverkehrsunfaelle['LOR'].astype('int64').astype(str).str[:-2].str.zfill(6)
+    categories = {1: 'Unfall mit Getöteten', 2: 'Unfall mit Schwerverletzten', 3: 'Unfall mit Leichtverletzten'}
+    counts = pd.crosstab(key_2.rename('key_2'), df_Straßenverkehrsunfaelle['UKATEGORIE'])
+    counts = counts.reindex(columns=list(categories), fill_value=0).rename(columns=categories).reset_index()
+    counts.columns.name = None
+    counts['year'] = year_of(path)
+    return counts[['key_2'] + ACCIDENTS + ['year']]
+
+
+def stage_accidents(paths):
+    Straßenverkehrsunfaelle = pd.concat([cached_file(path, read_accidents) for path in paths], ignore_index=True)
+    Straßenverkehrsunfaelle = Straßenverkehrsunfaelle.astype({variable: int for variable in ACCIDENTS + ['year']})
+    missing_years = [year for year in YEARS if year not in set(Straßenverkehrsunfaelle['year'])]
+    return imputation.impute(Straßenverkehrsunfaelle, 'key_2', missing_years, ACCIDENTS, IMPUTATION_METHOD)
+
+
+#Merging
+
+VARIABLE_NAMES = {"E insgesamt": "Total Population",
+                  "weiblich": "Female Population",
+                  "männlich": "Male Population",
+                  "E_U1": "Population  Infants",
+                  "E_1U6": "Population ages 1-6",
+                  "E_6U15": "Population ages 6-15",
+                  "E_15U18": "Population ages 15-18",
+                  "E_18U25": "Population ages 18-25",
+                  "E_25U35": "Population ages 25-35",
+                  "E_35U45": "Population ages 35-45",
+                  "E_45U55": "Population ages 45-55",
+                  "E_55U65": "Population ages 55-65",
+                  "E_65U80": "Population ages 65-80",
+                  "E_80U110": "Population ages 80-110",
+                  "WLEINF": "Simple residential area",
+                  "WLMIT": "Average residential area",
+                  "WLGUT": "Good residential area",
+                  "WLNZORD": "Residential area without allocation",
+                  "area": "Area in square kilometers",
+                  "num_street_lights": "Number of street lights",
+                  "Einzelhandel mit Tabakwaren": "Tobacco retail dealers",
+                  "Einzelhandel mit Getränken": "Liquor stores",
+                  "Ausschank von Getränken": "Bars, pubs and clubs",
+                  "Spiel-, Wett- und Lotteriewesen": "Casinos and betting stores",
+                  "Unfall mit Leichtverletzten": "Accidents with minor injuries",
+                  "Unfall mit Schwerverletzten": "Accidents with major injuries",
+                  "Unfall mit Getöteten": "Accidents resulting in deaths"}
+
+
+def stage_merge(paths, keys, crime, population, shops, lighting, wohnlage, accidents):
+    # Merge datasets on key_1
+    df_merged_data_key_1 = pd.merge(crime, shops, on=['key_1', 'year'])
+    df_merged_data_key_1 = df_merged_data_key_1.sort_values(['key_1', 'year'])
+
+    # Merge datasets on key_2
+    df_merged_data_key_2 = population.merge(wohnlage, on=['key_2', 'year'])
+    df_merged_data_key_2 = df_merged_data_key_2.merge(lighting, on=['key_2', 'year'])
+    df_merged_data_key_2 = df_merged_data_key_2.merge(accidents, on=['key_2', 'year'])
+    df_merged_data_key_2 = df_merged_data_key_2.merge(keys, on=['key_2'])
+    df_merged_data_key_2 = df_merged_data_key_2.sort_values(['key_2', 'year']).reset_index(drop=True)
+
+    # merge key_1 and key_2 datasets
+    df_merged_data = pd.merge(df_merged_data_key_1, df_merged_data_key_2, on=['key_1', 'year'])
+    df_merged_data = df_merged_data.set_index(['key_1', 'key_2', 'Bezirksregion', 'year'], drop=True)
+
+    #due to discrepancies between key_1 and key_2, some key_2 areas in Charlottenburg-Wilmersdorf and
+    #Tempelhof-Schöneberg need to be summed up and grouped under key_1
+    df_merged_data = df_merged_data.groupby(['key_1', 'year', 'Bezirksregion']).sum()
+    df_merged_data = df_merged_data.apply(pd.to_numeric).astype(float)
+
+    # variables are translated into english for the dashboard
+    # As legal terms are not directly translatable, the types of crime will remain in German
+    return df_merged_data.rename(columns=VARIABLE_NAMES).reset_index()
+
+
+#Normalisation
+
+def stage_by_population(paths, merged):
+    df_merged_data = merged.set_index(['key_1', 'year', 'Bezirksregion'])
+    variables = df_merged_data.columns.tolist()
+    variables.remove('Total Population')
+    return df_merged_data[variables].div(df_merged_data['Total Population'], axis=0).reset_index()
+
+
+def stage_by_area(paths, merged):
+    df_merged_data = merged.set_index(['key_1', 'year', 'Bezirksregion'])
+    variables = df_merged_data.columns.tolist()
+    variables.remove('Area in square kilometers')
+    return df_merged_data[variables].div(df_merged_data['Area in square kilometers'], axis=0).reset_index()
+
+
+#Stages: name -> (input files, stages it depends on, function, version)
+#The version is part of the cache key and has to be increased whenever the code of a stage changes its output
+STAGES = {"keys": (lambda: [resolve(KEYS_PATH)], [], stage_keys, 1),
+          "crime": (lambda: [resolve(CRIME_PATH)], [], stage_crime, 1),
+          "population": (lambda: resolve_glob(POPULATION_GLOB), [], stage_population, 1),
+          "shops": (lambda: [resolve(SHOPS_PATH)], [], stage_shops, 2),
+          "lighting": (lambda: [resolve(path) for path in LOR_SHAPEFILE_PARTS] + resolve_glob(LIGHTING_GLOB), [], stage_lighting, 2),
+          "wohnlage": (lambda: resolve_glob(WOHNLAGE_GLOB), [], stage_wohnlage, 1),
+          "accidents": (lambda: resolve_glob(ACCIDENTS_GLOB), [], stage_accidents, 2),
+          "merge": (lambda: [], ["keys", "crime", "population", "shops", "lighting", "wohnlage", "accidents"], stage_merge, 1),
+          "by_population": (lambda: [], ["merge"], stage_by_population, 1),
+          "by_area": (lambda: [], ["merge"], stage_by_area, 1)}
+
+#Excel files the dashboard and the notebook load, written from the stage outputs
+OUTPUTS = {"keys": "Data/df_keys.xlsx",
+           "merge": "Data/df_merged.xlsx",
+           "by_population": "Data/df_by_population.xlsx",
+           "by_area": "Data/df_by_area.xlsx"}
+
+
+def stage_hash(name, dependency_hashes):
+    inputs, dependencies, _, version = STAGES[name]
+    content = {"stage": name, "version": version,
+               "inputs": {os.path.basename(path): data_store.file_digest(path) for path in inputs()},
+               "dependencies": {dependency: dependency_hashes[dependency] for dependency in dependencies}}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def stage_cache_path(name, digest):
+    return os.path.join(CACHE_DIR, f"{name}-{digest[:16]}.parquet")
+
+
+#Run a stage and cache its output. Module level so it can run in a worker process
+def run_stage(name, digest, dependency_frames):
+    inputs, _, func, _ = STAGES[name]
+    start = time.perf_counter()
+    df = func(inputs(), *dependency_frames)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    df.to_parquet(stage_cache_path(name, digest))
+    return df, time.perf_counter() - start
+
+
+#Run all stages in dependency order. Stages whose dependencies are done run in parallel, cached outputs are reused
+def run(force=(), workers=None):
+    hashes, frames = {}, {}
+    pending = list(STAGES)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while pending:
+            ready = [name for name in pending if all(dependency in frames for dependency in STAGES[name][1])]
+            futures = {}
+            for name in ready:
+                hashes[name] = stage_hash(name, hashes)
+                cache_path = stage_cache_path(name, hashes[name])
+                if os.path.exists(cache_path) and name not in force and not any(dependency in force for dependency in STAGES[name][1]):
+                    frames[name] = pd.read_parquet(cache_path)
+                    print(f"{name:<14} cached")
+                else:
+                    force = set(force) | {name}
+                    futures[name] = pool.submit(run_stage, name, hashes[name], [frames[dependency] for dependency in STAGES[name][1]])
+            for name, future in futures.items():
+                frames[name], duration = future.result()
+                print(f"{name:<14} {duration:6.1f}s  {len(frames[name])} rows")
+            pending = [name for name in pending if name not in ready]
+    return frames
+
+
+#Write the stage outputs in the format of the Excel files the dashboard loads
+def write_outputs(frames):
+    for name, path in OUTPUTS.items():
+        df = frames[name]
+        if name != "keys":
+            df = df.set_index(['key_1', 'year', 'Bezirksregion'])
+        df.to_excel(path, index=True)
+        print(f"{name:<14} -> {path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the merged datasets of the dashboard")
+    parser.add_argument("--stages", nargs="*", default=[], choices=list(STAGES), help="stages to run again even if they are cached")
+    parser.add_argument("--workers", type=int, default=None, help="processes running independent stages (default: all cores)")
+    parser.add_argument("--no-store", action="store_true", help="do not rebuild the Parquet data store of the dashboard")
+    args = parser.parse_args()
+
+    frames = run(args.stages, args.workers)
+    write_outputs(frames)
+    if not args.no_store:
+        data_store.build_store()
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import data_store
+
+#Training stage producing the feature importances of the dashboard's importance pie for every type of crime
+#Every crime type is a separate model. The models are trained concurrently on a process pool, every worker uses a fixed
+#number of threads so workers x threads matches the cores. Models and importances are cached in Data/cache/importances
+#keyed by the model, the target, the feature set and a hash of the training data, so only targets whose data changed
+#are trained again.
+#  python feature_importance.py --model h2o --workers 4 --threads 2
+#  python feature_importance.py --model random_forest
+
+CACHE_DIR = "Data/cache/importances"
+OUTPUTS = {"h2o": "Data/H20AutoML_treemodels_importances.xlsx",
+           "random_forest": "Data/df_RF_feature_importances.xlsx"}
+#increase when the training of a model changes its results, so cached models are not reused
+MODEL_VERSIONS = {"h2o": 2, "random_forest": 1}
+H2O_BASE_PORT = 54321
+
+#set by the worker initializer
+_worker = {"threads": None, "port": None}
+
+
+#Limit the native thread pools of a worker before any model is trained in it
+def _init_worker(threads, counter):
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    _worker["threads"] = threads
+    #every worker runs its own H2O cluster, each H2O node uses two consecutive ports
+    _worker["port"] = H2O_BASE_PORT + 2 * index
+    for variable in ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]:
+        os.environ[variable] = str(threads)
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(threads)
+
+
+#Random Forest as in the notebook: 80/20 split, scaled features, absolute error criterion
+def train_random_forest(dff, target, features, key):
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_squared_error, mean_absolute_error
+
+    dff_train, dff_test = train_test_split(dff[features + [target]], test_size=0.2, random_state=0)
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(dff_train[features].values)
+    X_test = scaler.transform(dff_test[features].values)
+
+    model = RandomForestRegressor(n_estimators=100, random_state=0, criterion='absolute_error', max_depth=None,
+                                  n_jobs=_worker["threads"])
+    model.fit(X_train, dff_train[target].values)
+    y_pred = model.predict(X_test)
+    metrics = {"MSE": mean_squared_error(dff_test[target].values, y_pred),
+               "MAE": mean_absolute_error(dff_test[target].values, y_pred)}
+    importances = pd.Series(model.feature_importances_, index=features)
+    return importances, metrics, pickle.dumps(model)
+
+
+#Best model of H2O AutoML restricted to tree models and GLM as in the notebook, on the worker's own H2O cluster.
+#The model ids are derived from a per-cluster counter and the start time (XGBoost_3_AutoML_1_<timestamp>), so workers
+#starting together produce the same ids. Every model is therefore saved in a directory named after its cache key, and
+#the AutoML project is named after the key as well (crime type names contain characters not allowed in H2O keys)
+def train_h2o(dff, target, features, key):
+    import h2o
+    from h2o.automl import H2OAutoML
+
+    if h2o.connection() is None or not h2o.cluster().is_running():
+        h2o.init(nthreads=_worker["threads"] or -1, port=_worker["port"] or H2O_BASE_PORT,
+                 name=f"feature_importance_{os.getpid()}", verbose=False)
+        h2o.no_progress()
+
+    hf = h2o.H2OFrame(dff[features + [target]])
+    train, test = hf.split_frame(ratios=[0.8], seed=1)
+    aml = H2OAutoML(max_models=5, seed=1, include_algos=["DRF", "GLM", "XGBoost"], project_name=f"importance_{key[:16]}")
+    aml.train(y=target, training_frame=train, leaderboard_frame=test)
+
+    performance = aml.leader.model_performance(test_data=test)
+    metrics = {"MSE": performance.mse(), "MAE": performance.mae(), "model": aml.leader.model_id}
+    varimp = aml.leader.varimp(use_pandas=True)
+    importances = varimp.set_index('variable')['percentage'].reindex(features)
+    model_path = h2o.save_model(aml.leader, path=os.path.join(CACHE_DIR, "h2o", key), force=True)
+    for frame in [hf, train, test]:
+        h2o.remove(frame)
+    return importances, metrics, model_path.encode()
+
+
+TRAINERS = {"h2o": train_h2o, "random_forest": train_random_forest}
+
+
+#Cache key of a model: the model and its version, the target, the feature set and the content of the training data
+def cache_key(model, dff, target, features):
+    data = pd.util.hash_pandas_object(dff[features + [target]], index=True).to_numpy().tobytes()
+    content = json.dumps({"model": model, "version": MODEL_VERSIONS[model], "target": target, "features": features})
+    return hashlib.sha256(content.encode() + hashlib.sha256(data).digest()).hexdigest()
+
+
+def cache_paths(key):
+    return os.path.join(CACHE_DIR, key + ".json"), os.path.join(CACHE_DIR, key + ".model")
+
+
+#Train the model of a single target and cache it. Module level so it can run in a worker process
+def train_target(model, dff, target, features, key):
+    start = time.perf_counter()
+    importances, metrics, serialized = TRAINERS[model](dff, target, features, key)
+    duration = time.perf_counter() - start
+    result_path, model_path = cache_paths(key)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(model_path, "wb") as f:
+        f.write(serialized)
+    with open(result_path, "w") as f:
+        json.dump({"target": target, "importances": importances.astype(float).to_dict(),
+                   "metrics": metrics, "seconds": duration}, f)
+    return importances, duration
+
+
+def load_cached(key):
+    result_path, model_path = cache_paths(key)
+    if not (os.path.exists(result_path) and os.path.exists(model_path)):
+        return None
+    with open(result_path) as f:
+        return pd.Series(json.load(f)["importances"], dtype=float)
+
+
+def run(model="h2o", workers=None, threads=1, output=None, force=False):
+    df = data_store.load_tables()["df_merged"].set_index(["key_1", "year", "Bezirksregion"])
+    Straftaten = df.columns.tolist()[:17]
+    variables = df.columns.tolist()[17:]
+    df_feature_importances = pd.DataFrame(index=Straftaten, columns=variables, dtype=float)
+
+    keys = {Straftat: cache_key(model, df, Straftat, variables) for Straftat in Straftaten}
+    pending = []
+    for Straftat in Straftaten:
+        cached = None if force else load_cached(keys[Straftat])
+        if cached is None:
+            pending.append(Straftat)
+        else:
+            df_feature_importances.loc[Straftat, variables] = cached.reindex(variables).to_numpy()
+            print(f"{Straftat:<55} cached")
+
+    if pending:
+        workers = workers or max(1, (os.cpu_count() or 1) // threads)
+        context = multiprocessing.get_context("spawn")
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=context,
+                                 initializer=_init_worker, initargs=(threads, context.Value("i", 0))) as pool:
+            futures = {Straftat: pool.submit(train_target, model, df, Straftat, variables, keys[Straftat]) for Straftat in pending}
+            for Straftat, future in futures.items():
+                importances, duration = future.result()
+                df_feature_importances.loc[Straftat, variables] = importances.reindex(variables).to_numpy()
+                print(f"{Straftat:<55} {duration:7.1f}s")
+        print(f"{len(pending)} targets trained in {time.perf_counter() - start:.1f}s with {workers} workers x {threads} threads")
+
+    output = OUTPUTS[model] if output is None else output
+    if output:
+        df_feature_importances.to_excel(output, index=True)
+        print(f"Importances written to {output}. Run `python data_store.py` to update the data store.", file=sys.stderr)
+    return df_feature_importances
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train a model per type of crime and write the feature importances of the dashboard")
+    parser.add_argument("--model", choices=list(TRAINERS), default="h2o")
+    parser.add_argument("--workers", type=int, default=None, help="processes training models (default: cores / threads)")
+    parser.add_argument("--threads", type=int, default=1, help="threads of every worker")
+    parser.add_argument("--output", default=None, help="Excel file the importances are written to, empty to skip")
+    parser.add_argument("--force", action="store_true", help="train all targets again even if they are cached")
+    args = parser.parse_args()
+    run(args.model, args.workers, args.threads, args.output, args.force)
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import functools
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import plotly.io as pio
+
+import instrumentation
+
+#Memoisation of the dashboard figures
+#The input space of the dashboard is small and closed, so every figure is cached as serialized plotly JSON keyed by the
+#version of the figures, the callback name and its inputs. The cache is bounded by size and evicts the least recently used figures.
+#  FIGURE_CACHE          "memory" (default, per worker), "disk" (sqlite file shared by all gunicorn workers) or "off"
+#  FIGURE_CACHE_MAX_MB   size bound in megabytes (default 64)
+#  FIGURE_CACHE_PATH     sqlite file of the disk backend (default Data/cache/figures.sqlite)
+#  FIGURE_CACHE_WARM     "1" prerenders the whole input space when the dashboard is imported,
+#                        f.ex. in the gunicorn master with --preload so all workers inherit a warm memory cache
+
+DEFAULT_PATH = "Data/cache/figures.sqlite"
+#seconds the disk backend keeps the last uses and counts of its hits before writing them
+FLUSH_INTERVAL = 5
+
+
+#Least recently used cache in the memory of a single process
+class MemoryBackend:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            text = self.entries.get(key)
+            if text is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return text
+
+    def set(self, key, text):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = text
+            self.size += len(text)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.counters["evictions"] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, entries=len(self.entries), bytes=self.size, max_bytes=self.max_bytes)
+
+
+#Least recently used cache in a sqlite file, shared by all processes on the machine. The counters are stored in the file too.
+#A hit only reads: the last use of the entries and the hit and miss counts are kept in the process and written in batches,
+#together with the next insert or at the latest after FLUSH_INTERVAL seconds, so hits of all workers don't queue for
+#the sqlite writer lock. Evictions may therefore see last uses that are up to FLUSH_INTERVAL seconds old.
+class DiskBackend:
+    def __init__(self, max_bytes, path=DEFAULT_PATH):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self.lock:
+            db = self.connection()
+            db.execute("CREATE TABLE IF NOT EXISTS figures (key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_used REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS figures_last_used ON figures (last_used)")
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            db.executemany("INSERT OR IGNORE INTO counters VALUES (?, 0)", [("hits",), ("misses",), ("evictions",)])
+            db.commit()
+
+    #sqlite connections must not be shared across fork, so every worker opens its own. The pending writes of the
+    #parent are its own, a forked worker starts without any
+    def connection(self):
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+            self._touched = {}
+            self._pending = {"hits": 0, "misses": 0}
+            self._flushed = time.monotonic()
+        return self._connection
+
+    #Write transaction that is rolled back on any error, f.ex. when the database stays locked longer than the timeout,
+    #so the connection is never left inside an open transaction
+    @contextmanager
+    def transaction(self, db):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+
+    def _count(self, db, name, n=1):
+        db.execute("UPDATE counters SET value = value + ? WHERE name = ?", (n, name))
+
+    #Write the pending last uses and counts inside a transaction, they are only discarded once it is committed
+    def _write_pending(self, db):
+        db.executemany("UPDATE figures SET last_used = ? WHERE key = ?", [(used, key) for key, used in self._touched.items()])
+        for name, n in self._pending.items():
+            if n:
+                self._count(db, name, n)
+
+    def _pending_written(self):
+        self._touched = {}
+        self._pending = dict.fromkeys(self._pending, 0)
+        self._flushed = time.monotonic()
+
+    def _flush(self, db):
+        if not self._touched and not any(self._pending.values()):
+            return
+        with self.transaction(db):
+            self._write_pending(db)
+        self._pending_written()
+
+    def get(self, key):
+        with self.lock:
+            db = self.connection()
+            row = db.execute("SELECT value FROM figures WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._pending["misses"] += 1
+                return None
+            self._touched[key] = time.time()
+            self._pending["hits"] += 1
+            if time.monotonic() - self._flushed > FLUSH_INTERVAL:
+                #a busy database only delays the batch, the hit is served anyway
+                try:
+                    self._flush(db)
+                except sqlite3.OperationalError:
+                    self._flushed = time.monotonic()
+            return row[0]
+
+    def set(self, key, text):
+        with self.lock:
+            db = self.connection()
+            with self.transaction(db):
+                self._write_pending(db)
+                db.execute("INSERT OR REPLACE INTO figures VALUES (?, ?, ?, ?)", (key, text, len(text), time.time()))
+                size = db.execute("SELECT COALESCE(SUM(size), 0) FROM figures").fetchone()[0]
+                evictions = 0
+                for old_key, old_size in db.execute("SELECT key, size FROM figures WHERE key != ? ORDER BY last_used", (key,)).fetchall():
+                    if size <= self.max_bytes:
+                        break
+                    db.execute("DELETE FROM figures WHERE key = ?", (old_key,))
+                    size -= old_size
+                    evictions += 1
+                if evictions:
+                    self._count(db, "evictions", evictions)
+            self._pending_written()
+
+    def stats(self):
+        with self.lock:
+            db = self.connection()
+            self._flush(db)
+            counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM figures").fetchone()
+            return dict(counters, entries=entries, bytes=size, max_bytes=self.max_bytes)
+
+
+class FigureCache:
+    def __init__(self, backend, version=""):
+        self.backend = backend
+        self.version = version
+
+    #Wrap a figure callback so its figures are served from the cache. Both paths return the figure as a dict
+    def cached(self, func):
+        if self.backend is None:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = self.version + ":" + func.__name__ + ":" + json.dumps(args, default=str)
+            with instrumentation.phase("cache"):
+                text = self.backend.get(key)
+            if text is None:
+                figure = func(*args)
+                with instrumentation.phase("serialize"):
+                    text = pio.to_json(figure, validate=False)
+                with instrumentation.phase("cache"):
+                    self.backend.set(key, text)
+            with instrumentation.phase("deserialize"):
+                return json.loads(text)
+        return wrapper
+
+    #Prerender every combination of inputs. input_space maps each cached callback to a list of argument tuples
+    def warm(self, input_space):
+        for func, combinations in input_space:
+            start = time.perf_counter()
+            for args in combinations:
+                func(*args)
+            print(f"{func.__name__}: {len(combinations)} figures in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        return self.stats()
+
+    def stats(self):
+        if self.backend is None:
+            return {}
+        return self.backend.stats()
+
+
+#Cache configured by the FIGURE_CACHE* environment variables. Figures cached with another version are not used
+def from_environment(version=""):
+    kind = os.environ.get("FIGURE_CACHE", "memory")
+    max_bytes = int(float(os.environ.get("FIGURE_CACHE_MAX_MB", "64")) * 1024 * 1024)
+    if kind == "memory":
+        return FigureCache(MemoryBackend(max_bytes), version)
+    if kind == "disk":
+        return FigureCache(DiskBackend(max_bytes, os.environ.get("FIGURE_CACHE_PATH", DEFAULT_PATH)), version)
+    if kind == "off":
+        return FigureCache(None, version)
+    raise ValueError(f"Unknown FIGURE_CACHE backend {kind!r}, use 'memory', 'disk' or 'off'")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prerender the dashboard figures into the shared disk cache at deploy time")
+    parser.add_argument("command", choices=["warm", "stats"])
+    args = parser.parse_args()
+
+    os.environ.setdefault("FIGURE_CACHE", "disk")
+    import dash_app
+
+    if args.command == "warm":
+        stats = dash_app.fig_cache.warm(dash_app.figure_input_space())
+    else:
+        stats = dash_app.fig_cache.stats()
+    print(json.dumps(stats, indent=2))
+    if stats and stats.get("evictions"):
+        print("Figures were evicted, FIGURE_CACHE_MAX_MB is too small to hold the whole input space.", file=sys.stderr)
@@ -0,0 +1,160 @@
+import os
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import data_store
+from etl import read_crime_year
+
+#Forecasting stage producing df_prophet_predictions for every Bezirksregion and type of crime
+#Every (key_1, crime type) series is forecasted on its own. "prophet" fits FB Prophet per series on a process pool,
+#"linear" and "holt" are vectorized fast paths that forecast all series at once with NumPy.
+#  python forecasting.py --method prophet --workers 8
+#The MAE and MSE of the hold-out year are written next to the predictions (<output>_holdout_errors.xlsx).
+
+OUTPUT_PATH = "Data/df_prophet_predictions.xlsx"
+METHODS = ["prophet", "linear", "holt"]
+#Smoothing parameters Holt's method is fitted over, for every series the pair with the smallest one-step SSE is used
+HOLT_GRID = np.round(np.arange(0.05, 1, 0.05), 2)
+
+
+#Matrix of all series (years x series) and the (key_1, Bezirksregion, crime type) label of every column
+def series_matrix(df, crime_types):
+    wide = df.pivot_table(index="year", columns=["key_1", "Bezirksregion"], values=crime_types, aggfunc="first")
+    wide = wide.reorder_levels([1, 2, 0], axis=1).sort_index(axis=1)
+    return wide.index.tolist(), wide.columns.tolist(), wide.to_numpy(dtype=float)
+
+
+#Silence cmdstanpy like the notebook did, once per worker process
+def _init_prophet_worker():
+    logger = logging.getLogger('cmdstanpy')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    logger.setLevel(logging.CRITICAL)
+
+
+#Fit Prophet to a single yearly series and predict the next years
+def _fit_prophet(task):
+    from sktime.forecasting.base import ForecastingHorizon
+    from sktime.forecasting.fbprophet import Prophet
+
+    values, first_year, horizon = task
+    y = pd.Series(values, index=pd.date_range(str(first_year), periods=len(values), freq="YS"))
+    fh = ForecastingHorizon(pd.date_range(str(first_year + len(values)), periods=horizon, freq="YS"), is_relative=False)
+    forecaster = Prophet()
+    forecaster.fit(y)
+    return forecaster.predict(fh).to_numpy()
+
+
+def forecast_prophet(Y, years, horizon, workers=None):
+    tasks = [(Y[:, i], years[0], horizon) for i in range(Y.shape[1])]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_prophet_worker) as pool:
+        chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+        return np.column_stack(list(pool.map(_fit_prophet, tasks, chunksize=chunksize)))
+
+
+#Linear trend of every series in a single least-squares solve
+def forecast_linear(Y, years, horizon):
+    X = np.column_stack([np.ones(len(years)), years])
+    coef = np.linalg.lstsq(X, Y, rcond=None)[0]
+    future = np.arange(years[-1] + 1, years[-1] + 1 + horizon)
+    return np.column_stack([np.ones(horizon), future]) @ coef
+
+
+#Holt's linear exponential smoothing of all series for smoothing parameters broadcastable against a series row.
+#Returns the final level and trend and the sum of squared one-step-ahead errors
+def holt_smooth(Y, alpha, beta):
+    level = Y[0] + np.zeros(np.broadcast_shapes(np.shape(alpha), np.shape(beta), Y[0].shape))
+    trend = Y[1] - Y[0] + np.zeros_like(level)
+    sse = np.zeros_like(level)
+    for t in range(1, len(Y)):
+        sse += (Y[t] - level - trend) ** 2
+        previous_level = level
+        level = alpha * Y[t] + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous_level) + (1 - beta) * trend
+    return level, trend, sse
+
+
+#Fit alpha and beta of every series on HOLT_GRID in one vectorized pass (grid x grid x series) by minimising the
+#in-sample one-step SSE, then forecast with the fitted level and trend
+def forecast_holt(Y, years, horizon, grid=HOLT_GRID):
+    level, trend, sse = holt_smooth(Y, grid[:, None, None], grid[None, :, None])
+    best = np.nan_to_num(sse, nan=np.inf).reshape(-1, Y.shape[1]).argmin(axis=0)
+    series = np.arange(Y.shape[1])
+    level = level.reshape(-1, Y.shape[1])[best, series]
+    trend = trend.reshape(-1, Y.shape[1])[best, series]
+    steps = np.arange(1, horizon + 1)[:, None]
+    return level + steps * trend
+
+
+#Actual values followed by the forecasts as a frame indexed like df_prophet_predictions (key_1, Bezirksregion, year)
+def predictions_frame(years, labels, Y, forecasts, crime_types):
+    all_years = list(years) + list(range(years[-1] + 1, years[-1] + 1 + len(forecasts)))
+    values = np.vstack([Y, forecasts])
+    #all values are non-negative integers, as in the notebook
+    values = np.where(values > 0, np.trunc(values), 0).astype(int)
+    columns = pd.MultiIndex.from_tuples(labels, names=["key_1", "Bezirksregion", "crime_type"])
+    wide = pd.DataFrame(values, index=pd.Index(all_years, name="year"), columns=columns)
+    long = wide.stack(["key_1", "Bezirksregion"], future_stack=True)
+    long = long.reorder_levels(["key_1", "Bezirksregion", "year"]).sort_index()
+    long.columns.name = None
+    return long[crime_types]
+
+
+#Mean absolute and mean squared error of the forecasts of a year against the actual crime statistics of that year
+def holdout_errors(df_predictions, df_actual, crime_types):
+    year = df_actual["year"].iloc[0]
+    predicted = df_predictions.xs(year, level="year").droplevel("Bezirksregion")[crime_types]
+    actual = df_actual.set_index("key_1")[crime_types]
+    errors = actual.subtract(predicted, fill_value=0)
+    return pd.DataFrame({"MAE": errors.abs().mean(), "MSE": (errors ** 2).mean()})
+
+
+def holdout_path(output):
+    return os.path.splitext(output)[0] + "_holdout_errors.xlsx"
+
+
+def run(method="prophet", horizon=5, workers=None, output=OUTPUT_PATH, holdout_year=2021):
+    df = data_store.load_tables()["df_merged"]
+    crime_types = [column for column in df.columns if column not in ("key_1", "year", "Bezirksregion")][:17]
+    years, labels, Y = series_matrix(df, crime_types)
+
+    start = time.perf_counter()
+    if method == "prophet":
+        forecasts = forecast_prophet(Y, years, horizon, workers)
+    elif method == "linear":
+        forecasts = forecast_linear(Y, years, horizon)
+    else:
+        forecasts = forecast_holt(Y, years, horizon)
+    duration = time.perf_counter() - start
+    print(f"{method}: {Y.shape[1]} series in {duration:.2f}s ({Y.shape[1] / duration:.0f} series/s)")
+
+    df_prophet_predictions = predictions_frame(years, labels, Y, forecasts, crime_types)
+
+    errors = None
+    if holdout_year in df_prophet_predictions.index.get_level_values("year"):
+        errors = holdout_errors(df_prophet_predictions, read_crime_year(holdout_year), crime_types)
+        print(f"Hold-out errors {holdout_year}:")
+        print(errors.to_string())
+
+    if output:
+        df_prophet_predictions.to_excel(output, index=True)
+        print(f"Predictions written to {output}. Run `python data_store.py` to update the data store.")
+        if errors is not None:
+            errors.rename_axis(f"{method} {holdout_year}").to_excel(holdout_path(output), index=True)
+            print(f"Hold-out errors written to {holdout_path(output)}")
+    return df_prophet_predictions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Forecast every Bezirksregion and type of crime")
+    parser.add_argument("--method", choices=METHODS, default="prophet")
+    parser.add_argument("--horizon", type=int, default=5, help="number of years to forecast")
+    parser.add_argument("--workers", type=int, default=None, help="processes fitting Prophet (default: all cores)")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="Excel file the predictions are written to, empty to skip")
+    args = parser.parse_args()
+    run(args.method, args.horizon, args.workers, args.output)
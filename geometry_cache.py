@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+
+import pandas as pd
+
+import data_store
+
+#Precomputed choropleth geometry
+#`python geometry_cache.py` dissolves the LOR Bezirksregionen into the 143 key_1 regions once and writes them as GeoJSON
+#keyed by key_1 (feature "id") for every simplification level. The dashboard serves these files and the map only references them.
+#The coordinates are snapped to a grid of COORDINATE_DECIMALS decimal places, which halves the size of the GeoJSON.
+
+SHAPEFILE = "Data/LOR/lor_shp_2019/Bezirksregion_EPSG_25833.shp"
+SHAPEFILE_PARTS = [SHAPEFILE, "Data/LOR/lor_shp_2019/Bezirksregion_EPSG_25833.SHX", "Data/LOR/lor_shp_2019/Bezirksregion_EPSG_25833.DBF"]
+GEOMETRY_DIR = "Data/geometry"
+MANIFEST_PATH = os.path.join(GEOMETRY_DIR, "manifest.json")
+
+#Simplification tolerances in degrees (EPSG:4326). "low" is the simplify(1) the dashboard has always used
+DETAIL_LEVELS = {"full": 0, "high": 0.0001, "medium": 0.001, "low": 1}
+DEFAULT_LEVEL = "low"
+
+#Decimal places of the coordinates in degrees, 5 are about 1 m in Berlin, far below the simplification tolerances
+COORDINATE_DECIMALS = 5
+
+_regions = None
+
+
+def geojson_path(level):
+    return os.path.join(GEOMETRY_DIR, f"bezirksregionen_{level}.geojson")
+
+
+#Inputs the geometry is derived from: the shapefile and the key_1/key_2 mapping
+def source_digests():
+    sources = SHAPEFILE_PARTS + [data_store.EXCEL_SOURCES["df_keys"][0]]
+    return {path: data_store.file_digest(path) for path in sources if os.path.exists(path)}
+
+
+#The cached files are stale when their sources or the coordinate precision changed
+def manifest():
+    return {"sources": source_digests(), "coordinate_decimals": COORDINATE_DECIMALS}
+
+
+#Dissolve the Bezirksregionen spatial data into one geometry per key_1
+def build_regions(df_keys=None):
+    import geopandas as gpd
+
+    if df_keys is None:
+        df_keys = data_store.read_excel_table("df_keys")
+    Bezirksregionen_spatial = gpd.read_file(SHAPEFILE)
+    Bezirksregionen_spatial.crs = "epsg:25833"
+    Bezirksregionen_spatial = Bezirksregionen_spatial.to_crs(epsg=4326)
+    Bezirksregionen_spatial = Bezirksregionen_spatial.rename(columns={'SCHLUESSEL': 'key_2'})
+    Bezirksregionen_spatial = Bezirksregionen_spatial[['key_2', 'geometry']]
+    Bezirksregionen_spatial = pd.merge(Bezirksregionen_spatial, df_keys[['key_1', 'key_2']], on='key_2')
+    regions = Bezirksregionen_spatial.dissolve(by='key_1')
+    return regions[['geometry']]
+
+
+#Serialize the regions at a simplification level as a compact GeoJSON FeatureCollection with key_1 as feature id.
+#set_precision snaps the coordinates to the grid and drops the vertices that collapse, the polygons stay valid
+def regions_to_geojson(regions, level):
+    tolerance = DETAIL_LEVELS[level]
+    geometry = regions.geometry.simplify(tolerance) if tolerance else regions.geometry
+    quantized = regions.assign(geometry=geometry.set_precision(10 ** -COORDINATE_DECIMALS))
+    return quantized.to_json(show_bbox=False, separators=(",", ":"))
+
+
+def build_cache(df_keys=None):
+    os.makedirs(GEOMETRY_DIR, exist_ok=True)
+    regions = build_regions(df_keys)
+    for level in DETAIL_LEVELS:
+        text = regions_to_geojson(regions, level)
+        with open(geojson_path(level), "w") as f:
+            f.write(text)
+        print(f"{level}: {len(regions)} regions, {len(text) / 1024:.0f} KiB -> {geojson_path(level)}")
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest(), f, indent=2)
+
+
+def cache_is_fresh():
+    if not os.path.exists(MANIFEST_PATH):
+        return False
+    if not all(os.path.exists(geojson_path(level)) for level in DETAIL_LEVELS):
+        return False
+    with open(MANIFEST_PATH) as f:
+        return json.load(f) == manifest()
+
+
+#Load the GeoJSON text of every level, building the geometry in-process if the cache is missing or stale
+def load_geojson_texts(df_keys=None):
+    global _regions
+    if cache_is_fresh():
+        texts = {}
+        for level in DETAIL_LEVELS:
+            with open(geojson_path(level)) as f:
+                texts[level] = f.read()
+        return texts
+    print("Geometry cache missing or stale, dissolving the shapefile. Run `python geometry_cache.py` to rebuild it.", file=sys.stderr)
+    if _regions is None:
+        _regions = build_regions(df_keys)
+    return {level: regions_to_geojson(_regions, level) for level in DETAIL_LEVELS}
+
+
+if __name__ == '__main__':
+    build_cache()
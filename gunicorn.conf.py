@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+
+#gunicorn configuration with the shared memory data plane (shared_data.py)
+#The master loads the tables and builds the query layer once and publishes it to shared memory before the workers are
+#started. The app is not preloaded, so the workers import the dashboard without loading any data and attach to the
+#shared arrays instead. gunicorn reads this file from the working directory by default.
+#  gunicorn dash_app:server
+#  GUNICORN_WORKERS=8 GUNICORN_BIND=0.0.0.0:8050 gunicorn dash_app:server
+#Without GUNICORN_BIND and GUNICORN_WORKERS gunicorn's defaults apply: one worker bound to 0.0.0.0:$PORT when the host
+#sets PORT (f.ex. Render), 127.0.0.1:8000 otherwise. --bind and --workers on the command line take precedence.
+
+if os.environ.get("GUNICORN_BIND"):
+    bind = os.environ["GUNICORN_BIND"]
+elif os.environ.get("PORT"):
+    bind = f"0.0.0.0:{os.environ['PORT']}"
+if os.environ.get("GUNICORN_WORKERS"):
+    workers = int(os.environ["GUNICORN_WORKERS"])
+preload_app = False
+
+#/metrics sums the metrics of all workers (instrumentation.py), in a directory of this server unless METRICS_DIR is set.
+#Snapshots of earlier runs in it are removed at start, the histograms of exited workers are folded into exited.json
+_metrics_dir = None
+if not os.environ.get("METRICS_DIR"):
+    _metrics_dir = os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="dashboard-metrics-")
+
+_segment = None
+
+
+def on_starting(server):
+    global _segment
+    import shared_data
+    import instrumentation
+
+    instrumentation.clear_snapshots()
+    #with --preload the master has already imported the dashboard and its data, the workers share it copy-on-write
+    if server.cfg.preload_app:
+        return
+    _, geometry_json, crime_queries = shared_data.load_dashboard_data()
+    _segment = shared_data.publish(crime_queries, geometry_json)
+    #inherited by every worker forked afterwards
+    os.environ[shared_data.SEGMENT_ENV] = _segment.name
+    server.log.info(f"Shared data published to {_segment.name} ({_segment.size / 1e6:.1f} MB)")
+    for stage, seconds in instrumentation.startup_seconds.items():
+        server.log.info(f"Startup stage {stage}: {seconds:.2f}s")
+
+
+#The last metrics of a worker, f.ex. one recycled after max_requests, are written before it exits
+def worker_exit(server, worker):
+    import instrumentation
+
+    instrumentation.write_snapshot()
+
+
+def child_exit(server, worker):
+    import instrumentation
+
+    instrumentation.fold_exited(worker.pid)
+
+
+def on_exit(server):
+    import shared_data
+
+    if _segment is not None:
+        shared_data.release(_segment)
+    if _metrics_dir is not None:
+        shutil.rmtree(_metrics_dir, ignore_errors=True)
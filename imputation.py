@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+#Imputation of the years missing in a source (f.ex. accidents before 2018, Spätis/bars before 2016)
+#The observed values are arranged as a region x year x variable array (NaN where a region has no row for a year) and
+#every method fits all regions and variables at once instead of a model per region and variable. Some regions have
+#several rows per year, the array holds their mean and the number of rows is used as the weight of the year, so the
+#fit is the same as a fit to the individual rows.
+#  linear         linear trend per region and variable, the closed-form least-squares solution of all series at once
+#  log_linear     linear trend of log(1 + value), i.e. a constant growth rate
+#  carry_forward  last observed value before the year, the first observed value for years before the first observation
+#Predictions are clipped to non-negative values and truncated to integers like the notebook did.
+#  df = impute(df, 'key_2', [2012, ..., 2017], ACCIDENTS, method="linear")
+
+
+#Dense region x year x variable array of the mean observed values and the number of rows of every region and year
+def region_year_array(df, key, variables):
+    regions = pd.Index(sorted(df[key].unique()))
+    years = np.array(sorted(df['year'].unique()), dtype=float)
+    r = regions.get_indexer(df[key])
+    y = pd.Index(years).get_indexer(df['year'].astype(float))
+    sums = np.zeros((len(regions), len(years), len(variables)))
+    np.add.at(sums, (r, y), df[variables].to_numpy(dtype=float))
+    weights = np.zeros((len(regions), len(years), 1))
+    np.add.at(weights, (r, y), 1)
+    values = np.divide(sums, weights, out=np.full_like(sums, np.nan), where=weights > 0)
+    return regions, years, values, weights
+
+
+#Weighted least-squares line through the observed values of every series, evaluated at the target years.
+#A series with a single observed year is predicted as its value
+def fit_linear(years, values, weights, target_years):
+    w = np.where(np.isnan(values), 0, weights)
+    y = np.nan_to_num(values)
+    n = w.sum(axis=1, keepdims=True)
+    x_mean = (w * years[None, :, None]).sum(axis=1, keepdims=True) / n
+    y_mean = (w * y).sum(axis=1, keepdims=True) / n
+    dx = years[None, :, None] - x_mean
+    sxx = (w * dx ** 2).sum(axis=1, keepdims=True)
+    slope = np.divide((w * dx * (y - y_mean)).sum(axis=1, keepdims=True), sxx, out=np.zeros_like(sxx), where=sxx > 0)
+    return y_mean + slope * (np.asarray(target_years, dtype=float)[None, :, None] - x_mean)
+
+
+def fit_log_linear(years, values, weights, target_years):
+    return np.expm1(fit_linear(years, np.log1p(np.maximum(values, 0)), weights, target_years))
+
+
+def fit_carry_forward(years, values, weights, target_years):
+    observed = ~np.isnan(values)
+    #index of the last observation up to every year, or of the first observation if there is none before it
+    positions = np.where(observed, np.arange(len(years))[None, :, None], -1)
+    last = np.maximum.accumulate(positions, axis=1)
+    first = np.argmax(observed, axis=1)[:, None, :]
+    source = np.where(last >= 0, last, first)
+    filled = np.take_along_axis(values, source, axis=1)
+    #the last observed year before each target year, target years before the first observed year use the first one
+    column = np.clip(np.searchsorted(years, target_years, side="right") - 1, 0, None)
+    return filled[:, column]
+
+
+METHODS = {"linear": fit_linear,
+           "log_linear": fit_log_linear,
+           "carry_forward": fit_carry_forward}
+
+
+#Predicted values of the variables for every region of df in the given years, as rows like the rows of df
+def predict(df, key, years, variables, method="linear"):
+    if method not in METHODS:
+        raise ValueError(f"Unknown imputation method {method!r}, use one of {', '.join(METHODS)}")
+    regions, observed_years, values, weights = region_year_array(df, key, variables)
+    predictions = METHODS[method](observed_years, values, weights, years)
+    predictions = np.trunc(np.maximum(np.nan_to_num(predictions), 0)).astype(int)
+
+    frame = pd.DataFrame(predictions.reshape(-1, len(variables)), columns=variables)
+    frame.insert(0, key, np.repeat(regions.to_numpy(), len(years)))
+    frame.insert(1, 'year', np.tile(np.asarray(years, dtype=int), len(regions)))
+    return frame
+
+
+#df with the predicted rows of the missing years appended, sorted by region and year
+def impute(df, key, years, variables, method="linear"):
+    df = pd.concat([df, predict(df, key, years, variables, method)])
+    df = df.set_index([key], append=True).astype(int).reset_index([key])
+    return df.sort_values([key, 'year']).reset_index(drop=True)
@@ -0,0 +1,302 @@
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+
+#Timing of the dashboard's startup stages, callbacks and requests
+#Every callback is split into phases (query: data selection, figure: px.* construction, layout: update_layout and
+#update_traces calls, cache: figure cache lookups, serialize/deserialize: plotly JSON), startup into stages (table
+#loading, geometry, query layer, ...). The timings are collected per process as Prometheus histograms served at
+#/metrics and optionally written as one JSON line per callback, request and startup stage.
+#  INSTRUMENTATION_LOG   "1" writes the structured logs to stderr
+#  METRICS_DIR           directory shared by the processes of a server, f.ex. the gunicorn workers. Every process writes
+#                        a snapshot of its metrics to <pid>.json in it (at most once per SNAPSHOT_INTERVAL seconds) and
+#                        /metrics sums the histograms of all snapshots, so every worker answers a scrape with the same
+#                        totals. The histograms of an exited worker are folded into exited.json (fold_exited, called by
+#                        gunicorn.conf.py), so the counters never go backwards and the number of files stays bounded.
+#                        gunicorn.conf.py sets it by default and clears it at server start. Without it every worker
+#                        only reports its own metrics, labelled with its pid, and needs its own scrape target.
+#The startup stages are reported per running process, labelled with its pid.
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+METRICS_DIR = os.environ.get("METRICS_DIR")
+SNAPSHOT_INTERVAL = 1
+EXITED = "exited"
+
+logger = logging.getLogger("instrumentation")
+if os.environ.get("INSTRUMENTATION_LOG") == "1" and not logger.handlers:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class Histogram:
+    def __init__(self, name, description, labels, buckets=BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            counts = self.series.setdefault(label_values, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            counts[0][bisect.bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+            counts[2] += 1
+        _changed()
+
+    #Series as JSON: [label values, bucket counts, sum, count]
+    def snapshot(self):
+        with self.lock:
+            return [[list(labels), list(counts), total, count] for labels, (counts, total, count) in self.series.items()]
+
+    #Sum of the series of several snapshots
+    @staticmethod
+    def merge(snapshots):
+        series = {}
+        for snapshot in snapshots:
+            for labels, counts, total, count in snapshot:
+                merged = series.setdefault(tuple(labels), [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return series
+
+    #Lines of the Prometheus text format, the bucket counts are cumulative. series defaults to the own series
+    def exposition(self, extra_labels, series=None):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        if series is None:
+            series = self.merge([self.snapshot()])
+        for label_values, (counts, total, count) in sorted(series.items()):
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.labels, label_values))
+            labels = ",".join(filter(None, [labels, extra_labels]))
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+phase_seconds = Histogram("dashboard_callback_phase_seconds", "Duration of a phase of a dashboard callback", ["callback", "phase"])
+callback_seconds = Histogram("dashboard_callback_seconds", "Duration of a dashboard callback", ["callback"])
+request_seconds = Histogram("dashboard_request_seconds", "Duration of a _dash-update-component request including Dash's own serialisation", ["output"])
+response_bytes = Histogram("dashboard_response_bytes", "Size of a _dash-update-component response as sent, after compression", ["output", "encoding"], SIZE_BUCKETS)
+startup_seconds = {}
+HISTOGRAMS = [callback_seconds, phase_seconds, request_seconds, response_bytes]
+
+_current = threading.local()
+_writer = {"pid": None, "dirty": False, "lock": threading.Lock(), "write_lock": threading.Lock()}
+
+
+def _log(event, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(dict(event=event, pid=os.getpid(), **fields), default=str))
+
+
+#Time a phase of the callback running in this thread, f.ex. with phase("query"): ...
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        phases = getattr(_current, "phases", None)
+        callback = getattr(_current, "callback", None) or "none"
+        phase_seconds.observe(duration, callback, name)
+        if phases is not None:
+            phases[name] = phases.get(name, 0) + duration
+
+
+#Wrap a callback so its total duration and the duration of its phases are recorded
+def instrumented(func):
+    @functools.wraps(func)
+    def wrapper(*args):
+        outer = getattr(_current, "callback", None), getattr(_current, "phases", None)
+        _current.callback, _current.phases = func.__name__, {}
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            duration = time.perf_counter() - start
+            callback_seconds.observe(duration, func.__name__)
+            _log("callback", callback=func.__name__, args=args, seconds=round(duration, 6),
+                 phases={name: round(seconds, 6) for name, seconds in _current.phases.items()})
+            _current.callback, _current.phases = outer
+    return wrapper
+
+
+#Time a startup stage, f.ex. with startup_stage("load_tables"): ...
+@contextmanager
+def startup_stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        startup_seconds[name] = duration
+        _log("startup", stage=name, seconds=round(duration, 6))
+        _changed()
+
+
+def snapshot():
+    return {"startup": dict(startup_seconds), "histograms": {histogram.name: histogram.snapshot() for histogram in HISTOGRAMS}}
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+#Replace the snapshot of this process in the metrics directory
+def write_snapshot(directory=None):
+    with _writer["write_lock"]:
+        _write_json(os.path.join(directory or METRICS_DIR, f"{os.getpid()}.json"), snapshot())
+
+
+#Snapshots of all processes by pid, a snapshot being replaced right now is skipped, and so is the snapshot of a worker
+#that is being folded into exited.json
+def read_snapshots(directory=None):
+    directory = directory or METRICS_DIR
+    snapshots = {}
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshots[name[:-5]] = json.load(f)
+            except (OSError, ValueError):
+                continue
+    for pid in snapshots.get(EXITED, {}).get("folding", []):
+        snapshots.pop(str(pid), None)
+    return snapshots
+
+
+#Add the histograms of an exited process to exited.json and remove its snapshot and its startup stages. Called by the
+#gunicorn master for every exited worker, after the worker wrote its last snapshot
+def fold_exited(pid, directory=None):
+    directory = directory or METRICS_DIR
+    path = os.path.join(directory, f"{pid}.json")
+    try:
+        with open(path) as f:
+            process = json.load(f)
+    except (OSError, ValueError):
+        return
+    exited_path = os.path.join(directory, EXITED + ".json")
+    try:
+        with open(exited_path) as f:
+            exited = json.load(f)
+    except (OSError, ValueError):
+        exited = {"startup": {}, "histograms": {}}
+    histograms = {}
+    for histogram in HISTOGRAMS:
+        series = Histogram.merge([exited["histograms"].get(histogram.name, []), process["histograms"].get(histogram.name, [])])
+        histograms[histogram.name] = [[list(labels), counts, total, count] for labels, (counts, total, count) in series.items()]
+    #the folded snapshot is skipped by the readers until it is removed, so a scrape never counts it twice
+    _write_json(exited_path, {"startup": {}, "histograms": histograms, "folding": [pid]})
+    os.remove(path)
+    _write_json(exited_path, {"startup": {}, "histograms": histograms})
+
+
+#Remove the snapshots of earlier runs, except the one of this process
+def clear_snapshots(directory=None):
+    directory = directory or METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith((".json", ".json.tmp")) and not name.startswith(f"{os.getpid()}.json"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                continue
+
+
+#Mark the metrics as changed, a background thread of every process writes them to METRICS_DIR
+def _changed():
+    if not METRICS_DIR:
+        return
+    _writer["dirty"] = True
+    if _writer["pid"] != os.getpid():
+        with _writer["lock"]:
+            if _writer["pid"] != os.getpid():
+                _writer["pid"] = os.getpid()
+                threading.Thread(target=_write_snapshots, name="metrics-snapshots", daemon=True).start()
+
+
+def _write_snapshots():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        if _writer["dirty"]:
+            _writer["dirty"] = False
+            try:
+                write_snapshot()
+            except OSError:
+                _writer["dirty"] = True
+
+
+#A forked worker starts with empty histograms and startup stages, the parent's observations (f.ex. loading the data or
+#warming the figure cache in the gunicorn master) are in the parent's own snapshot and would be counted once per worker otherwise
+def _reset_after_fork():
+    _writer["lock"] = threading.Lock()
+    _writer["write_lock"] = threading.Lock()
+    if METRICS_DIR:
+        startup_seconds.clear()
+        for histogram in HISTOGRAMS:
+            histogram.lock = threading.Lock()
+            histogram.series = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def metrics_text():
+    if METRICS_DIR:
+        write_snapshot()
+        snapshots, worker = read_snapshots(), ""
+    else:
+        snapshots, worker = {str(os.getpid()): snapshot()}, f'pid="{os.getpid()}"'
+    lines = ["# HELP dashboard_startup_seconds Duration of a startup stage of the dashboard",
+             "# TYPE dashboard_startup_seconds gauge"]
+    for pid, process in sorted(snapshots.items()):
+        lines += [f'dashboard_startup_seconds{{stage="{name}",pid="{pid}"}} {seconds}' for name, seconds in process["startup"].items()]
+    for histogram in HISTOGRAMS:
+        series = Histogram.merge([process["histograms"].get(histogram.name, []) for process in snapshots.values()])
+        lines += histogram.exposition(worker, series)
+    return "\n".join(lines) + "\n"
+
+
+#Time the Dash update requests of a Flask server and serve the metrics at /metrics
+def register(server, path="/metrics"):
+    from flask import Response, g, request
+
+    @server.before_request
+    def start_timer():
+        g.instrumentation_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        start = g.pop("instrumentation_start", None)
+        if start is not None and request.path.endswith("/_dash-update-component"):
+            duration = time.perf_counter() - start
+            output = (request.get_json(silent=True) or {}).get("output", "unknown")
+            size = response.calculate_content_length() or 0
+            encoding = response.headers.get("Content-Encoding", "identity")
+            request_seconds.observe(duration, output)
+            response_bytes.observe(size, output, encoding)
+            _log("request", output=output, status=response.status_code, seconds=round(duration, 6), bytes=size, encoding=encoding)
+        return response
+
+    @server.route(path)
+    def metrics():
+        return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import functools
+
+import plotly.io as pio
+import plotly.graph_objects as go
+
+#Smaller figures and compressed, cacheable responses of the dashboard server
+#Every plotly figure carries its template. Instead of the full plotly_dark template with defaults for every trace type
+#and subplot, all figures use the "dashboard" template: the parts of plotly_dark their bar, pie and choropleth traces
+#use, with the transparent backgrounds the figures used to set one by one. The server figures are sent without it: the
+#page loads the template once into a dcc.Store and assets/figure_template.js puts it back into every figure in the browser.
+#Responses, the callback JSON, the GeoJSON geometry and the assets, are compressed with brotli or gzip (flask-compress).
+#Assets and the geometry are linked with a version in their URL and served with an ETag and a long Cache-Control max-age.
+#  RESPONSE_COMPRESSION   "0" disables the compression, f.ex. behind a proxy that compresses
+
+TEMPLATE_NAME = "dashboard"
+TEMPLATE_BASE = "plotly_dark"
+TEMPLATE_TRACES = ["bar", "pie", "choropleth"]
+TEMPLATE_LAYOUT = ["autotypenumbers", "colorway", "font", "hovermode", "hoverlabel", "coloraxis", "xaxis", "yaxis", "geo", "title"]
+TRANSPARENT = "rgba(0, 0, 0, 0)"
+
+COMPRESS_ALGORITHMS = ["br", "gzip"]
+COMPRESS_STREAMING_ALGORITHMS = ["br", "deflate"]
+#quality 5 compresses every response better than gzip at a similar speed, flask-compress defaults to 4
+COMPRESS_BR_LEVEL = 5
+COMPRESS_MIMETYPES = ["application/json", "application/geo+json", "text/html", "text/css", "application/javascript",
+                      "text/javascript"]
+
+#Dash links the assets with their modification time (?m=...) and the map references the geometry with its digest
+#(?v=...), so a changed file gets a new URL and the cached ones can be kept for a year, like Dash's component suites
+MAX_AGE = 31536000
+
+
+def build_template():
+    base = pio.templates[TEMPLATE_BASE].to_plotly_json()
+    data = {trace: base["data"][trace] for trace in TEMPLATE_TRACES if trace in base["data"]}
+    layout = {key: base["layout"][key] for key in TEMPLATE_LAYOUT if key in base["layout"]}
+    layout.update(paper_bgcolor=TRANSPARENT, plot_bgcolor=TRANSPARENT)
+    return go.layout.Template(data=data, layout=layout)
+
+
+#Register the dashboard template as the default of all figures built afterwards
+def register_template():
+    pio.templates[TEMPLATE_NAME] = build_template()
+    pio.templates.default = TEMPLATE_NAME
+
+
+#The template as plain JSON for the dcc.Store of the page
+def template_json():
+    return pio.templates[TEMPLATE_NAME].to_plotly_json()
+
+
+#Wrap a figure function so its figures are returned without the template, the browser adds it from the page's store
+def without_template(func):
+    @functools.wraps(func)
+    def wrapper(*args):
+        figure = func(*args)
+        figure.layout.template = None
+        return figure
+    return wrapper
+
+
+#Figure dict with the template put back, for figures that are sent within the page and not through a callback
+def with_template(figure):
+    if isinstance(figure, go.Figure):
+        figure = figure.to_plotly_json()
+    layout = dict(figure.get("layout", {}), template=template_json())
+    return dict(figure, layout=layout)
+
+
+#Short content digest of a text or bytes-like object, used as ETag and URL version
+def digest(data):
+    return hashlib.sha256(data.encode() if isinstance(data, str) else data).hexdigest()[:16]
+
+
+#Version of the figures: they are built with the template and from everything passed (URLs, data digests, code versions),
+#so cached figures are only valid while all of them are unchanged
+def figure_version(*parts):
+    template = json.dumps(pio.templates[TEMPLATE_NAME].to_plotly_json(), sort_keys=True)
+    return digest("\n".join([template, *map(str, parts)]))
+
+
+#Compression of the responses and caching headers of the assets. Called after instrumentation.register(server), so the
+#response sizes at /metrics are the compressed sizes (Flask runs the after_request hooks in reverse order)
+def register(server):
+    server.config["SEND_FILE_MAX_AGE_DEFAULT"] = MAX_AGE
+    if os.environ.get("RESPONSE_COMPRESSION", "1") != "1":
+        return
+    import flask_compress
+
+    #compressed files get a new ETag, so the conditional requests for them are evaluated after the compression
+    static_endpoints = [rule.endpoint for rule in server.url_map.iter_rules() if rule.endpoint.split(".")[-1] == "static"]
+    server.config.update(COMPRESS_ALGORITHM=COMPRESS_ALGORITHMS,
+                         COMPRESS_ALGORITHM_STREAMING=COMPRESS_STREAMING_ALGORITHMS,
+                         COMPRESS_BR_LEVEL=COMPRESS_BR_LEVEL,
+                         COMPRESS_MIMETYPES=COMPRESS_MIMETYPES,
+                         COMPRESS_STREAMING_ENDPOINT_CONDITIONAL=static_endpoints)
+    flask_compress.Compress(server)
+
+
+#Response with an ETag and a long max-age, answered with 304 Not Modified when the client has it already
+def cacheable_response(data, mimetype, etag):
+    from flask import Response, request
+
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = MAX_AGE
+    return response.make_conditional(request)
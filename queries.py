@@ -0,0 +1,127 @@
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+#Query layer for the dashboard callbacks
+#All lookups the callbacks need are answered from dense arrays built once at load time:
+#  values       view x year x region x variable  (views: Total, Per capita, Per square kilometer)
+#  ranking      year x crime type x region       region indices of the Total view, highest value first
+#  predictions  region x year x crime type       actual values and forecasts
+#so every lookup is a dictionary access plus a single slice instead of boolean masks over the merged frames.
+
+VIEWS = ["Total", "Per capita", "Per square kilometer"]
+
+
+class CrimeQueries:
+    def __init__(self, years, key_1, regions, variables, crime_types, pred_years, values, ranking, predictions, importances,
+                 digest=None):
+        self.years = list(years)
+        self.key_1 = list(key_1)
+        self.regions = list(regions)
+        self.variables = list(variables)
+        self.crime_types = list(crime_types)
+        self.pred_years = list(pred_years)
+        self.values = values
+        self.ranking = ranking
+        self.predictions = predictions
+        self.importances = importances
+        self._digest = digest
+
+        self.view_index = {view: i for i, view in enumerate(VIEWS)}
+        self.year_index = {year: i for i, year in enumerate(self.years)}
+        self.variable_index = {variable: i for i, variable in enumerate(self.variables)}
+        self.crime_type_index = {crime_type: i for i, crime_type in enumerate(self.crime_types)}
+        #if a Bezirksregion name occurs twice, the first region is used as the callbacks always did
+        self.region_index = {}
+        for i, region in enumerate(self.regions):
+            self.region_index.setdefault(region, i)
+
+    #Content digest of the names, arrays and importances, the figures built from the query layer are cached under it
+    def digest(self):
+        if self._digest is None:
+            content = hashlib.sha256()
+            metadata = [self.years, self.key_1, self.regions, self.variables, self.crime_types, self.pred_years,
+                        {crime_type: series.to_dict() for crime_type, series in self.importances.items()}]
+            content.update(json.dumps(metadata, default=str).encode())
+            for array in [self.values, self.ranking, self.predictions]:
+                content.update(f"{array.dtype.str}{array.shape}".encode())
+                content.update(np.ascontiguousarray(array).data)
+            self._digest = content.hexdigest()[:16]
+        return self._digest
+
+    #Values of some variables for a single region and year of the Total view
+    def region_values(self, year, region, variables):
+        columns = [self.variable_index[variable] for variable in variables]
+        return self.values[0, self.year_index[year], self.region_index[region], columns]
+
+    #Names and values of the n regions with the highest value of a crime type in a year
+    def top_regions(self, year, crime_type, n=10):
+        y, c = self.year_index[year], self.crime_type_index[crime_type]
+        order = self.ranking[y, c, :n]
+        values = self.values[0, y, order, self.variable_index[crime_type]]
+        order, values = order[~np.isnan(values)], values[~np.isnan(values)]
+        return [self.regions[i] for i in order], values
+
+    #Value of a variable for all regions (in key_1 order) in a view and year
+    def value_vector(self, view, year, variable):
+        return self.values[self.view_index[view], self.year_index[year], :, self.variable_index[variable]]
+
+    #Value of a variable for all years x regions in a view
+    def value_matrix(self, view, variable):
+        return self.values[self.view_index[view], :, :, self.variable_index[variable]]
+
+    #Actual and forecasted values of a crime type for a region, one per prediction year
+    def region_predictions(self, region, crime_type):
+        return self.predictions[self.region_index[region], :, self.crime_type_index[crime_type]]
+
+    #The five most important features for a crime type and the remaining importance
+    def top_features(self, crime_type):
+        return self.importances[crime_type]
+
+
+#Dense year x region x variable array of a flat dataframe (columns key_1, year, ..., variables)
+def _dense_values(df, years, key_1, variables):
+    dense = np.full((len(years), len(key_1), len(variables)), np.nan)
+    y = pd.Index(years).get_indexer(df["year"])
+    r = pd.Index(key_1).get_indexer(df["key_1"])
+    found = (y >= 0) & (r >= 0)
+    dense[y[found], r[found]] = df.reindex(columns=variables).to_numpy(dtype=float)[found]
+    return dense
+
+
+#Top-n features of every crime type plus the remaining importance, as a series per crime type
+def _ranked_importances(df_feature_importances, crime_types, n=5):
+    importances = {}
+    for crime_type in crime_types:
+        if crime_type not in df_feature_importances.index:
+            continue
+        top_features = df_feature_importances.loc[crime_type].astype(float).nlargest(n)
+        top_features["remaining"] = 1-sum(top_features)
+        importances[crime_type] = top_features
+    return importances
+
+
+#Build the query layer from the dataframes loaded by the dashboard
+def build_queries(df, df_per_pop, df_per_area, df_pred, df_feature_importances, variables, crime_types):
+    regions = df[["key_1", "Bezirksregion"]].drop_duplicates("key_1").sort_values("key_1")
+    key_1 = regions["key_1"].tolist()
+    years = sorted(df["year"].unique().tolist())
+
+    values = np.stack([_dense_values(frame, years, key_1, variables) for frame in [df, df_per_pop, df_per_area]])
+
+    #stable sort keeps the key_1 order for ties like nlargest does, NaN values are sorted last
+    crime_columns = [variables.index(crime_type) for crime_type in crime_types]
+    ranking = np.argsort(-values[0][:, :, crime_columns], axis=1, kind="stable").transpose(0, 2, 1)
+    ranking = np.ascontiguousarray(ranking.astype(np.int32))
+
+    df_pred = df_pred.reset_index()
+    pred_years = sorted(df_pred["year"].unique().tolist())
+    predictions = _dense_values(df_pred, pred_years, key_1, crime_types).transpose(1, 0, 2)
+    predictions = np.ascontiguousarray(predictions)
+
+    importances = _ranked_importances(df_feature_importances, crime_types)
+
+    return CrimeQueries(years, key_1, regions["Bezirksregion"].tolist(), variables, crime_types, pred_years,
+                        values, ranking, predictions, importances)
@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import data_store
+import geometry_cache
+import queries
+import instrumentation
+
+#Read-only shared memory data plane for gunicorn workers
+#The gunicorn master (gunicorn.conf.py) loads the tables once, builds the query layer and publishes its arrays and the
+#map geometry into a single POSIX shared memory segment. Workers attach to the segment and read the arrays zero-copy,
+#so they never load the tables and hold no DataFrames of their own. The map geometry is stored once per region as the
+#dissolved GeoJSON of every detail level.
+#  gunicorn -c gunicorn.conf.py dash_app:server
+#The segment starts with the length of a JSON manifest followed by the manifest, which holds the offsets of the arrays
+#and geometry texts and the small metadata of the query layer (names of regions, variables, years, importances, digest).
+#The startup stages of the master are reported at /metrics under the master's pid, the workers only report attaching.
+
+SEGMENT_ENV = "SHARED_DATA"
+ARRAYS = ["values", "ranking", "predictions"]
+ALIGNMENT = 64
+HEADER = 8
+
+# Variables excluded from the dropdown menus
+EXCLUDED_VARIABLES = ["Total Population", "Area in square kilometers", "key_1", "geometry", "key_2", "year", "Bezirksregion"]
+
+
+#Load the tables, the map geometry and build the query layer of the dashboard
+def load_dashboard_data():
+    #load data from the Parquet data store (built with `python data_store.py`), falling back to the saved excel files
+    with instrumentation.startup_stage("load_tables"):
+        tables = data_store.load_tables()
+
+    #dissolved and simplified Bezirksregionen geometry as GeoJSON keyed by key_1 (built with `python geometry_cache.py`)
+    with instrumentation.startup_stage("geometry"):
+        geometry_json = geometry_cache.load_geojson_texts(tables["df_keys"])
+
+    # The first 17 variables are the types of crime, the first of them being "Straftaten insgesamt"
+    variables = [var for var in tables["df_merged"].columns if var not in EXCLUDED_VARIABLES]
+    crime_types = variables[:17]
+
+    # Dense lookup arrays for all (year, region, variable) queries of the callbacks, built once
+    with instrumentation.startup_stage("queries"):
+        crime_queries = queries.build_queries(tables["df_merged"], tables["df_by_population"], tables["df_by_area"],
+                                              tables["df_prophet_predictions"], tables["feature_importances"],
+                                              variables, crime_types)
+    return tables, geometry_json, crime_queries
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+#Copy the arrays of the query layer and the geometry texts into a new shared memory segment.
+#The creating process owns the segment and has to unlink it with release()
+def publish(crime_queries, geometry_json):
+    arrays = {name: np.ascontiguousarray(getattr(crime_queries, name)) for name in ARRAYS}
+    texts = {level: text.encode() for level, text in geometry_json.items()}
+    manifest = {"years": crime_queries.years, "key_1": crime_queries.key_1, "regions": crime_queries.regions,
+                "variables": crime_queries.variables, "crime_types": crime_queries.crime_types,
+                "pred_years": crime_queries.pred_years,
+                "importances": {crime_type: series.to_dict() for crime_type, series in crime_queries.importances.items()},
+                "digest": crime_queries.digest(), "arrays": {}, "geometry": {}}
+
+    #offsets are relative to the end of the manifest, so the manifest's size does not depend on them
+    offset = 0
+    for name, array in arrays.items():
+        manifest["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    for level, data in texts.items():
+        manifest["geometry"][level] = [offset, len(data)]
+        offset = _aligned(offset + len(data))
+    encoded = json.dumps(manifest).encode()
+    start = _aligned(HEADER + len(encoded))
+
+    segment = shared_memory.SharedMemory(create=True, size=start + offset)
+    segment.buf[:HEADER] = len(encoded).to_bytes(HEADER, "little")
+    segment.buf[HEADER:HEADER + len(encoded)] = encoded
+    for name, array in arrays.items():
+        position = start + manifest["arrays"][name]["offset"]
+        segment.buf[position:position + array.nbytes] = array.tobytes()
+    for level, data in texts.items():
+        position = start + manifest["geometry"][level][0]
+        segment.buf[position:position + len(data)] = data
+    return segment
+
+
+def release(segment):
+    segment.close()
+    segment.unlink()
+
+
+#Open an existing segment without handing it to the resource tracker, which would unlink it when the worker exits.
+#Before python 3.13 the segment is not registered at all: forked workers share the tracker of the master, unregistering
+#it afterwards would drop the master's registration and the tracker fails when the master unlinks the segment
+def _open(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+#Query layer and geometry backed by the shared memory segment. The arrays are read-only views of the segment and the
+#geometry texts are memoryviews of it
+def attach(name):
+    segment = _open(name)
+    length = int.from_bytes(segment.buf[:HEADER], "little")
+    manifest = json.loads(bytes(segment.buf[HEADER:HEADER + length]))
+    start = _aligned(HEADER + length)
+
+    arrays = {}
+    for array_name, layout in manifest["arrays"].items():
+        array = np.ndarray(layout["shape"], dtype=np.dtype(layout["dtype"]), buffer=segment.buf, offset=start + layout["offset"])
+        array.flags.writeable = False
+        arrays[array_name] = array
+    geometry_json = {level: segment.buf[start + offset:start + offset + size] for level, (offset, size) in manifest["geometry"].items()}
+    importances = {crime_type: pd.Series(values, dtype=float) for crime_type, values in manifest["importances"].items()}
+
+    crime_queries = queries.CrimeQueries(manifest["years"], manifest["key_1"], manifest["regions"], manifest["variables"],
+                                         manifest["crime_types"], manifest["pred_years"], arrays["values"],
+                                         arrays["ranking"], arrays["predictions"], importances, manifest["digest"])
+    #the segment has to stay open as long as the arrays are used
+    crime_queries.segment = segment
+    return crime_queries, geometry_json
+
+
+#Attach to the segment published by the gunicorn master, None when the dashboard runs without shared data
+def attach_from_environment():
+    name = os.environ.get(SEGMENT_ENV)
+    if not name:
+        return None
+    with instrumentation.startup_stage("attach_shared_data"):
+        return attach(name)
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+#Aggregation of point datasets (street lights, amenities, accident locations) to the Bezirksregionen
+#Points are built vectorized with shapely.points and matched to the regions in the native EPSG:25833 CRS of the LOR
+#shapefile, so the points are never reprojected. Every chunk of points is indexed in an STRtree and queried with the
+#prepared region polygons, which evaluates the predicate far faster than testing every point against the polygons.
+#The sources are processed one chunk at a time and only the counts per region are kept, so memory does not grow with
+#the size of the dataset.
+#  regions = load_regions(LOR_SHAPEFILE)
+#  counts = count_points(regions, read_chunks(paths, ["East", "North"]))
+
+NATIVE_CRS = "epsg:25833"
+CHUNKSIZE = 100_000
+
+
+#Bezirksregionen of the LOR shapefile in their native CRS
+def load_regions(shapefile, crs=NATIVE_CRS):
+    import geopandas as gpd
+
+    regions = gpd.read_file(shapefile)
+    if regions.crs is None:
+        regions = regions.set_crs(crs)
+    return regions.to_crs(crs)
+
+
+#Chunks of the coordinate columns of point files. CSV and Parquet files are streamed, Excel files can only be read as a
+#whole and are processed one file at a time
+def read_chunks(paths, columns, chunksize=CHUNKSIZE, **kwargs):
+    for path in paths:
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".csv":
+            yield from pd.read_csv(path, usecols=columns, chunksize=chunksize, **kwargs)
+        elif extension == ".parquet":
+            import pyarrow.parquet as pq
+
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+                yield batch.to_pandas()
+        else:
+            df = pd.read_excel(path, usecols=columns, **kwargs)
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+
+
+#Number of points in every region. The regions are matched with the "intersects" predicate like gpd.sjoin does, so a
+#point on a shared border counts for both regions and points outside of all regions are ignored.
+#With by, the points are counted per value of that column as well and a region x value frame is returned.
+#Coordinates in another CRS than the regions (f.ex. the EPSG:25832 LINREFX/LINREFY of the accident data) are
+#transformed by passing their crs
+def count_points(regions, chunks, x="East", y="North", by=None, key="SCHLUESSEL", predicate="intersects", crs=None):
+    import shapely
+    import geopandas as gpd
+
+    polygons = regions.geometry.values
+    shapely.prepare(polygons)
+    counts = {}
+    for chunk in chunks:
+        chunk = chunk.dropna(subset=[x, y])
+        points = shapely.points(chunk[x].to_numpy(dtype=float), chunk[y].to_numpy(dtype=float))
+        if crs is not None:
+            points = gpd.GeoSeries(points, crs=crs).to_crs(regions.crs).values
+        region_index, point_index = shapely.STRtree(points).query(polygons, predicate=predicate)
+        if by is None:
+            groups = {None: region_index}
+        else:
+            values = chunk[by].to_numpy()[point_index]
+            groups = {value: region_index[values == value] for value in pd.unique(values)}
+        for value, index in groups.items():
+            counts[value] = counts.get(value, 0) + np.bincount(index, minlength=len(regions))
+
+    index = pd.Index(regions[key], name=key)
+    if by is None:
+        return pd.Series(counts.get(None, np.zeros(len(regions), dtype=np.int64)), index=index, name="count")
+    return pd.DataFrame({value: counts[value] for value in sorted(counts)}, index=index).rename_axis(columns=by)